@@ -1,41 +1,62 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from fastapi.responses import JSONResponse
-from models import ActivityCreate, ActivityUpdate, ActivityResponse, ErrorResponse
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Request
+from fastapi.responses import ORJSONResponse
+from models import ActivityCreate, ActivityUpdate, ActivityResponse, ActivityBulkResponse, ErrorResponse
 from database import get_activity_database
+from activity_import import ImportFormatError, ImportTooLarge, UnsupportedImportType, read_import, validate_import
 from middleware import require_auth
-from typing import List
+from typing import List, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Largest page that can be requested when listing activities
+MAX_PAGE_SIZE = 500
+
+# Response header carrying the cursor of the next page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Largest number of activities accepted by one bulk create
+MAX_BULK_ITEMS = 1000
+
+# Largest bulk create body, in bytes
+MAX_BULK_BYTES = 5 * 1024 * 1024
+
 # Create the activities router
 router = APIRouter(prefix="/api/v1/activities", tags=["activities"])
 
 
-@router.get("", response_model=List[ActivityResponse], responses={401: {"model": ErrorResponse}})
-async def get_activities(current_user=Depends(require_auth)):
+@router.get("", response_model=List[ActivityResponse], responses={400: {"model": ErrorResponse}, 401: {"model": ErrorResponse}})
+async def get_activities(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user=Depends(require_auth)
+):
     """
-    Get all activities for the current user.
+    Get the activities of the current user, sorted by date (newest first).
+    
+    - **limit**: Max activities to return; without it all activities are returned
+    - **cursor**: The `X-Next-Cursor` header of the previous page, to get the page after it
     
-    Returns a list of activities sorted by date (newest first).
+    When more activities follow, the response has an `X-Next-Cursor` header.
     """
     try:
         activity_db = get_activity_database()
-        activities = await activity_db.get_activities_by_user(str(current_user.id))
+        try:
+            activity_responses, next_cursor = await activity_db.get_activity_page(str(current_user.id), limit, cursor)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
         
-        # Convert to response format
-        activity_responses = []
-        for activity in activities:
-            activity_responses.append(ActivityResponse(
-                id=str(activity.id),
-                title=activity.title,
-                date=activity.date,
-                status=activity.status
-            ))
+        headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor is not None else None
         
         logger.info(f"Retrieved {len(activity_responses)} activities for user {current_user.email}")
-        return activity_responses
+        # The bodies come straight from trusted documents, so skip response_model validation
+        return ORJSONResponse(activity_responses, headers=headers)
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting activities for user {current_user.email}: {e}")
         raise HTTPException(
@@ -51,6 +72,7 @@ async def create_activity(activity_data: ActivityCreate, current_user=Depends(re
     
     - **title**: Activity title (1-200 characters)
     - **date**: Activity date in ISO format
+    - **latitude**, **longitude**: Optional location, given together
     
     Returns the created activity with generated ID and status.
     """
@@ -65,6 +87,8 @@ async def create_activity(activity_data: ActivityCreate, current_user=Depends(re
             id=str(created_activity.id),
             title=created_activity.title,
             date=created_activity.date,
+            latitude=created_activity.latitude,
+            longitude=created_activity.longitude,
             status=created_activity.status
         )
         
@@ -79,6 +103,63 @@ async def create_activity(activity_data: ActivityCreate, current_user=Depends(re
         )
 
 
+@router.post("/bulk", response_model=ActivityBulkResponse, responses={400: {"model": ErrorResponse}, 401: {"model": ErrorResponse}, 413: {"model": ErrorResponse}, 415: {"model": ErrorResponse}})
+async def bulk_create_activities(request: Request, current_user=Depends(require_auth)):
+    """
+    Create many activities for the current user in one request.
+    
+    The body is one of:
+    - `application/json`: an array of activities, as for a single create
+    - `application/x-ndjson`: one activity object per line
+    - `text/calendar`: an iCalendar file; each event's SUMMARY, DTSTART and GEO become an activity
+    
+    At most 1000 activities and 5 MB per request. Valid entries are created even if others fail;
+    every entry that was not created is reported with its position and the reason.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    try:
+        items = await read_import(content_type, request.stream(), MAX_BULK_ITEMS, MAX_BULK_BYTES)
+    except UnsupportedImportType as e:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=str(e)
+        )
+    except ImportTooLarge as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+    except ImportFormatError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    try:
+        activity_db = get_activity_database()
+        
+        # Validate everything first, then write all valid activities together
+        valid, errors = validate_import(items)
+        created, failed = await activity_db.create_activities(
+            [activity_data for _, activity_data in valid], str(current_user.id)
+        )
+        errors += [(valid[position][0], error) for position, error in failed]
+        errors.sort()
+        
+        logger.info(f"Bulk created {len(created)} of {len(items)} activities for user {current_user.email}")
+        return ORJSONResponse({
+            "created": created,
+            "errors": [{"index": index, "error": error} for index, error in errors],
+        })
+        
+    except Exception as e:
+        logger.error(f"Error bulk creating activities for user {current_user.email}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error creating activities"
+        )
+
+
 @router.put("/{activity_id}", response_model=ActivityResponse, responses={400: {"model": ErrorResponse}, 401: {"model": ErrorResponse}, 404: {"model": ErrorResponse}})
 async def update_activity(activity_id: str, activity_data: ActivityUpdate, current_user=Depends(require_auth)):
     """
@@ -87,27 +168,21 @@ async def update_activity(activity_id: str, activity_data: ActivityUpdate, curre
     - **activity_id**: The ID of the activity to update
     - **title**: Updated activity title (1-200 characters)
     - **date**: Updated activity date in ISO format
+    - **latitude**, **longitude**: Updated location; leave both out to keep the stored
+      location, or send both as null to remove it
     
     Returns the updated activity.
     """
     try:
         activity_db = get_activity_database()
         
-        # Check if activity exists and belongs to user
-        existing_activity = await activity_db.get_activity_by_id(activity_id, str(current_user.id))
-        if not existing_activity:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Activity not found"
-            )
-        
-        # Update the activity
+        # Update the activity; only activities that exist and belong to the user match
         updated_activity = await activity_db.update_activity(activity_id, activity_data, str(current_user.id))
         
         if not updated_activity:
             raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to update activity"
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Activity not found"
             )
         
         # Convert to response format
@@ -115,6 +190,8 @@ async def update_activity(activity_id: str, activity_data: ActivityUpdate, curre
             id=str(updated_activity.id),
             title=updated_activity.title,
             date=updated_activity.date,
+            latitude=updated_activity.latitude,
+            longitude=updated_activity.longitude,
             status=updated_activity.status
         )
         
@@ -143,21 +220,13 @@ async def delete_activity(activity_id: str, current_user=Depends(require_auth)):
     try:
         activity_db = get_activity_database()
         
-        # Check if activity exists and belongs to user
-        existing_activity = await activity_db.get_activity_by_id(activity_id, str(current_user.id))
-        if not existing_activity:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Activity not found"
-            )
-        
-        # Delete the activity
+        # Delete the activity; only activities that exist and belong to the user match
         deleted = await activity_db.delete_activity(activity_id, str(current_user.id))
         
         if not deleted:
             raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to delete activity"
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Activity not found"
             )
         
         logger.info(f"Deleted activity {activity_id} for user {current_user.email}")
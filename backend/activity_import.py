@@ -0,0 +1,278 @@
+"""
+Parsing and validation of bulk activity imports.
+
+Activities can be imported as a JSON array, as NDJSON (one JSON object per line) or
+as an iCalendar file, where every VEVENT becomes an activity (SUMMARY is the title,
+DTSTART the date and GEO the optional location). NDJSON and iCalendar bodies are read
+line by line as they arrive. Every format produces plain field dicts, or the reason an
+entry could not be read, which are then validated against ActivityCreate in one pass.
+"""
+import json
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from pydantic import ValidationError
+from models import ActivityCreate
+from cache_keys import LOCAL_TIMEZONE
+
+JSON_CONTENT_TYPES = {"application/json"}
+NDJSON_CONTENT_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl"}
+ICS_CONTENT_TYPES = {"text/calendar"}
+
+# Longest NDJSON or iCalendar line accepted, in bytes (folded iCalendar lines count per physical line)
+MAX_LINE_BYTES = 64 * 1024
+
+# An entry of an import: the fields of one activity, or why they could not be read
+ImportItem = Union[Dict[str, Any], str]
+
+
+class ImportFormatError(ValueError):
+    """Raised when an import body as a whole cannot be read."""
+
+
+class UnsupportedImportType(ValueError):
+    """Raised for a content type that is not an import format."""
+
+
+class ImportTooLarge(ImportFormatError):
+    """Raised when an import body is larger than allowed."""
+
+
+async def _limit_size(chunks: AsyncIterator[bytes], max_bytes: int) -> AsyncIterator[bytes]:
+    """Pass a streamed body through, failing as soon as it grows beyond max_bytes."""
+    received = 0
+    async for chunk in chunks:
+        received += len(chunk)
+        if received > max_bytes:
+            raise ImportTooLarge(f"Import must not be larger than {max_bytes} bytes")
+        yield chunk
+
+
+async def _iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Split a streamed body into lines without reading it whole."""
+    line = bytearray()
+    async for chunk in chunks:
+        start = 0
+        while True:
+            end = chunk.find(b"\n", start)
+            piece_end = len(chunk) if end == -1 else end
+            if len(line) + piece_end - start > MAX_LINE_BYTES:
+                raise ImportFormatError(f"Lines must not be longer than {MAX_LINE_BYTES} bytes")
+            line += chunk[start:piece_end]
+            if end == -1:
+                break
+            yield _decode(line)
+            line.clear()
+            start = end + 1
+    if line:
+        yield _decode(line)
+
+
+def _decode(line: bytearray) -> str:
+    try:
+        return line.decode("utf-8").rstrip("\r")
+    except UnicodeDecodeError:
+        raise ImportFormatError("Import must be UTF-8 encoded")
+
+
+def _as_item(value: Any) -> ImportItem:
+    if not isinstance(value, dict):
+        return "Expected a JSON object"
+    return value
+
+
+def parse_json_array(body: bytes) -> List[ImportItem]:
+    """Read a JSON array of activity objects."""
+    try:
+        values = json.loads(body)
+    except ValueError as e:
+        raise ImportFormatError(f"Invalid JSON: {e}")
+    if not isinstance(values, list):
+        raise ImportFormatError("Expected a JSON array of activities")
+    return [_as_item(value) for value in values]
+
+
+async def parse_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[ImportItem]:
+    """Read one activity object per non-empty line."""
+    async for line in _iter_lines(chunks):
+        if not line.strip():
+            continue
+        try:
+            yield _as_item(json.loads(line))
+        except ValueError as e:
+            yield f"Invalid JSON: {e}"
+
+
+def _unescape_text(value: str) -> str:
+    """Undo iCalendar TEXT escaping (\\n, \\, \\; and \\\\)."""
+    result = []
+    characters = iter(value)
+    for character in characters:
+        if character == "\\":
+            escaped = next(characters, "")
+            result.append("\n" if escaped in ("n", "N") else escaped)
+        else:
+            result.append(character)
+    return "".join(result)
+
+
+def _ics_timezone(tzid: Optional[str]) -> ZoneInfo:
+    """
+    Get the zone of a TZID parameter. Floating times (no TZID) and zones that are not IANA
+    names (e.g. Outlook's "W. Europe Standard Time") are taken as Dutch local time, the
+    timezone SunnyDays works in.
+    """
+    if not tzid:
+        return LOCAL_TIMEZONE
+    try:
+        return ZoneInfo(tzid)
+    except (ZoneInfoNotFoundError, ValueError):
+        return LOCAL_TIMEZONE
+
+
+def _parse_ics_date(value: str, parameters: Dict[str, str]) -> datetime:
+    """
+    Parse a DTSTART value into a UTC datetime. Times are UTC ("...Z"), in the zone of
+    their TZID, or floating, which is taken as Dutch local time. All-day dates stay
+    naive midnight so they keep their calendar day.
+    """
+    value = value.strip()
+    if parameters.get("VALUE") == "DATE" or len(value) == 8:
+        return datetime.strptime(value, "%Y%m%d")
+    if value.endswith("Z"):
+        return datetime.strptime(value, "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc)
+    local_time = datetime.strptime(value, "%Y%m%dT%H%M%S")
+    return local_time.replace(tzinfo=_ics_timezone(parameters.get("TZID"))).astimezone(timezone.utc)
+
+
+def _event_to_item(properties: Dict[str, Tuple[Dict[str, str], str]]) -> ImportItem:
+    """Turn the properties of one VEVENT into activity fields."""
+    if "SUMMARY" not in properties:
+        return "Event has no SUMMARY"
+    if "DTSTART" not in properties:
+        return "Event has no DTSTART"
+
+    parameters, value = properties["DTSTART"]
+    try:
+        date = _parse_ics_date(value, parameters)
+    except ValueError:
+        return f"Invalid DTSTART: {value}"
+    item: Dict[str, Any] = {"title": _unescape_text(properties["SUMMARY"][1]).strip(), "date": date}
+
+    if "GEO" in properties:
+        try:
+            latitude, longitude = properties["GEO"][1].split(";")
+            item["latitude"], item["longitude"] = float(latitude), float(longitude)
+        except ValueError:
+            return f"Invalid GEO: {properties['GEO'][1]}"
+    return item
+
+
+def _parse_property(line: str) -> Optional[Tuple[str, Dict[str, str], str]]:
+    """Split a content line like 'DTSTART;VALUE=DATE:20240101' into name, parameters and value."""
+    head, separator, value = line.partition(":")
+    if not separator:
+        return None
+    name, *parameter_parts = head.split(";")
+    parameters = {}
+    for part in parameter_parts:
+        key, _, parameter_value = part.partition("=")
+        parameters[key.upper()] = parameter_value.strip('"')
+    return name.upper(), parameters, value
+
+
+async def parse_ics(chunks: AsyncIterator[bytes]) -> AsyncIterator[ImportItem]:
+    """Read one activity per VEVENT of an iCalendar file."""
+    properties: Optional[Dict[str, Tuple[Dict[str, str], str]]] = None
+
+    def handle(line: str) -> Optional[ImportItem]:
+        nonlocal properties
+        parsed = _parse_property(line)
+        if parsed is None:
+            return None
+        name, parameters, value = parsed
+        if name == "BEGIN" and value.upper() == "VEVENT":
+            properties = {}
+        elif name == "END" and value.upper() == "VEVENT" and properties is not None:
+            item = _event_to_item(properties)
+            properties = None
+            return item
+        elif properties is not None:
+            # Only the first occurrence of a property counts
+            properties.setdefault(name, (parameters, value))
+        return None
+
+    # Long content lines are folded: a line starting with whitespace continues the previous one
+    logical_line: Optional[str] = None
+    async for line in _iter_lines(chunks):
+        if line[:1] in (" ", "\t") and logical_line is not None:
+            logical_line += line[1:]
+            continue
+        if logical_line is not None:
+            item = handle(logical_line)
+            if item is not None:
+                yield item
+        logical_line = line
+    if logical_line is not None:
+        item = handle(logical_line)
+        if item is not None:
+            yield item
+
+
+async def read_import(content_type: str, chunks: AsyncIterator[bytes], max_items: int,
+                      max_bytes: int) -> List[ImportItem]:
+    """
+    Read all entries of an import body of the given content type.
+    Raises UnsupportedImportType for an unknown content type, ImportTooLarge if the body
+    is larger than max_bytes and ImportFormatError if the body cannot be read, has a line
+    longer than MAX_LINE_BYTES or holds more than max_items entries.
+    """
+    chunks = _limit_size(chunks, max_bytes)
+    if content_type in JSON_CONTENT_TYPES:
+        body = bytearray()
+        async for chunk in chunks:
+            body += chunk
+        items = parse_json_array(body)
+        if len(items) > max_items:
+            raise ImportFormatError(f"At most {max_items} activities can be imported at once")
+        return items
+
+    if content_type in NDJSON_CONTENT_TYPES:
+        parser = parse_ndjson(chunks)
+    elif content_type in ICS_CONTENT_TYPES:
+        parser = parse_ics(chunks)
+    else:
+        raise UnsupportedImportType(f"Unsupported import type: {content_type or 'none'}")
+
+    items = []
+    async for item in parser:
+        # Stop reading as soon as the import is known to be too large
+        if len(items) == max_items:
+            raise ImportFormatError(f"At most {max_items} activities can be imported at once")
+        items.append(item)
+    return items
+
+
+def _describe_validation_error(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in detail['loc'])}: {detail['msg']}" if detail["loc"] else detail["msg"]
+        for detail in error.errors()
+    )
+
+
+def validate_import(items: List[ImportItem]) -> Tuple[List[Tuple[int, ActivityCreate]], List[Tuple[int, str]]]:
+    """
+    Validate every entry against ActivityCreate.
+    Returns the valid activities and the errors, each with its position in the import.
+    """
+    activities = []
+    errors = []
+    for index, item in enumerate(items):
+        if isinstance(item, str):
+            errors.append((index, item))
+            continue
+        try:
+            activities.append((index, ActivityCreate.model_validate(item)))
+        except ValidationError as e:
+            errors.append((index, _describe_validation_error(e)))
+    return activities, errors
@@ -0,0 +1,105 @@
+"""
+Benchmark the per-activity cost of serializing GET /api/v1/activities.
+
+Compares the validated path (a Pydantic model per document, re-validated through
+response_model and encoded by the standard JSONResponse) with the fast path
+(documents turned straight into dicts and encoded by ORJSONResponse). Run it from
+the backend directory:
+
+    python benchmarks/bench_activity_serialization.py --items 1000
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from database import ACTIVITY_LIST_PROJECTION, activity_doc_to_response  # noqa: E402
+from models import ActivityInDB, ActivityResponse  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+
+def make_documents(count: int) -> List[Dict[str, Any]]:
+    """Create activity documents as MongoDB returns them, full and projected."""
+    user_id = ObjectId()
+    start = datetime(2024, 1, 1, 9, 30)
+    documents = []
+    for index in range(count):
+        documents.append({
+            "_id": ObjectId(),
+            "title": f"Cycling tour {index}",
+            "date": start + timedelta(hours=index),
+            "latitude": 52.1 + index % 10 / 100,
+            "longitude": 5.18,
+            "userId": user_id,
+            "status": "future",
+            "createdAt": start,
+            "updatedAt": start,
+        })
+    return documents
+
+
+def validated_path(documents: List[Dict[str, Any]]) -> bytes:
+    """Model per document, then response_model validation and standard JSON encoding."""
+    activities = [ActivityInDB(**document) for document in documents]
+    responses = [
+        ActivityResponse(
+            id=str(activity.id),
+            title=activity.title,
+            date=activity.date,
+            latitude=activity.latitude,
+            longitude=activity.longitude,
+            status=activity.status
+        )
+        for activity in activities
+    ]
+    # What FastAPI does with response_model=List[ActivityResponse]
+    validated = TypeAdapter(List[ActivityResponse]).validate_python(responses, from_attributes=True)
+    content = jsonable_encoder(validated, by_alias=True)
+    return JSONResponse(content).body
+
+
+def fast_path(documents: List[Dict[str, Any]]) -> bytes:
+    """Projected documents straight into dicts, encoded with orjson."""
+    return ORJSONResponse([activity_doc_to_response(document) for document in documents]).body
+
+
+def measure(path: Callable[[List[Dict[str, Any]]], bytes], documents: List[Dict[str, Any]], repeat: int) -> float:
+    """Best-of-repeat time per item in microseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        path(documents)
+        best = min(best, time.perf_counter() - started)
+    return best / len(documents) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark activity list serialization.")
+    parser.add_argument("--items", type=int, default=1000, help="Activities per response")
+    parser.add_argument("--repeat", type=int, default=20, help="Runs per path; the fastest is reported")
+    args = parser.parse_args()
+
+    documents = make_documents(args.items)
+    # The listing query adds the computed status to the projected fields
+    projected = [
+        {**{field: document[field] for field in ACTIVITY_LIST_PROJECTION}, "status": document["status"]}
+        for document in documents
+    ]
+
+    validated_us = measure(validated_path, documents, args.repeat)
+    fast_us = measure(fast_path, projected, args.repeat)
+    print(f"{args.items} activities, best of {args.repeat} runs")
+    print(f"validated path: {validated_us:8.2f} µs per item")
+    print(f"fast path:      {fast_us:8.2f} µs per item ({validated_us / fast_us:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Benchmark KNMI Open Data downloads and daily record lookups against a local stand-in.
+
+A small HTTP server answers the Open Data endpoints the backend uses (file listing,
+temporary download URL and the download itself, with ETags) and serves a generated
+daily station data file. The benchmark downloads it through KNMIOpenDataClient, checks
+the cached copy and a sample of looked-up records against the generated data, and
+reports download, revalidation and lookup throughput. Run it from the backend directory:
+
+    python benchmarks/bench_knmi_open_data.py --days 10000
+
+With --serve only the stand-in is started, so the backend can be pointed at it:
+
+    python benchmarks/bench_knmi_open_data.py --serve --port 8001
+    KNMI_BASE_URL=http://127.0.0.1:8001 KNMI_DATASET=etmgeg python main.py
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from http_client import create_http_client  # noqa: E402
+from knmi_open_data import KNMIOpenDataClient, daily_record_to_weather, find_daily_record  # noqa: E402
+
+DATASET = "etmgeg"
+VERSION = "1"
+FILENAME = "etmgeg_bench.txt"
+STATIONS = [210, 240, 260, 280, 290, 310, 344, 350, 370, 380]
+COLUMNS = ["STN", "YYYYMMDD", "FG", "TG", "RH", "UG"]
+FIRST_DAY = datetime(1990, 1, 1)
+
+
+def make_data_file(days: int, seed: int = 1) -> Tuple[bytes, Dict[Tuple[int, str], List[str]]]:
+    """Generate a daily station data file and the row values it holds by (station, date)."""
+    rng = random.Random(seed)
+    lines = ["# Generated stand-in for KNMI daily station data", "# STN,YYYYMMDD,   FG,   TG,   RH,   UG"]
+    rows = {}
+    for station in STATIONS:
+        for offset in range(days):
+            day = (FIRST_DAY + timedelta(days=offset)).strftime("%Y%m%d")
+            values = [str(rng.randint(5, 120)), str(rng.randint(-80, 260)), str(rng.randint(-1, 300)), str(rng.randint(40, 99))]
+            rows[(station, day)] = values
+            lines.append(f"{station:>5},{day}," + ",".join(f"{value:>5}" for value in values))
+    return ("\r\n".join(lines) + "\r\n").encode(), rows
+
+
+class StandInServer:
+    """Threaded stand-in for the KNMI Open Data API serving a single dataset file."""
+
+    def __init__(self, body: bytes, host: str = "127.0.0.1", port: int = 0):
+        self.body = body
+        self.etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.base_url = f"http://{host}:{self.server.server_address[1]}"
+
+    def _handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                if re.fullmatch(r"/datasets/[^/]+/versions/[^/]+/files", path):
+                    self._json({"files": [{
+                        "filename": FILENAME,
+                        "size": len(stand_in.body),
+                        "lastModified": "2026-01-01T00:00:00+00:00",
+                    }]})
+                elif re.fullmatch(r"/datasets/[^/]+/versions/[^/]+/files/[^/]+/url", path):
+                    self._json({"temporaryDownloadUrl": f"{stand_in.base_url}/download/{FILENAME}"})
+                elif path == f"/download/{FILENAME}":
+                    if self.headers.get("If-None-Match") == stand_in.etag:
+                        self.send_response(304)
+                        self.send_header("ETag", stand_in.etag)
+                        self.end_headers()
+                        return
+                    self.send_response(200)
+                    self.send_header("Content-Length", str(len(stand_in.body)))
+                    self.send_header("ETag", stand_in.etag)
+                    self.end_headers()
+                    self.wfile.write(stand_in.body)
+                else:
+                    self.send_error(404)
+
+            def _json(self, content):
+                body = json.dumps(content).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> None:
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+async def bench_download(base_url: str, body: bytes, repeat: int) -> Tuple[float, float, Path, str]:
+    """
+    Best-of-repeat cold download time and conditional revalidation (304) time in seconds.
+    Returns them with the path of the last cached copy and the directory holding it.
+    """
+    client = create_http_client(base_url, 30)
+    best_download = best_revalidate = float("inf")
+    cache_dir = path = None
+    try:
+        for _ in range(repeat):
+            if cache_dir is not None:
+                shutil.rmtree(cache_dir)
+            cache_dir = tempfile.mkdtemp(prefix="knmi-bench-")
+            open_data = KNMIOpenDataClient(client, "bench", cache_dir)
+
+            started = time.perf_counter()
+            file_info = (await open_data.list_files(DATASET, VERSION))[0]
+            path = await open_data.download_file(DATASET, VERSION, file_info)
+            best_download = min(best_download, time.perf_counter() - started)
+            assert path.read_bytes() == body, "cached copy differs from the served file"
+
+            # A changed listing entry forces a conditional GET, answered with 304
+            started = time.perf_counter()
+            await open_data.download_file(DATASET, VERSION, {**file_info, "lastModified": "2026-01-02T00:00:00+00:00"})
+            best_revalidate = min(best_revalidate, time.perf_counter() - started)
+            assert open_data.downloads == 1 and open_data.cache_hits == 1
+    finally:
+        await client.aclose()
+    return best_download, best_revalidate, path, cache_dir
+
+
+def bench_lookups(path: Path, rows: Dict[Tuple[int, str], List[str]], lookups: int) -> float:
+    """Time per record lookup and conversion in microseconds, checking every result."""
+    rng = random.Random(2)
+    samples = rng.sample(sorted(rows), min(lookups, len(rows)))
+    started = time.perf_counter()
+    records = []
+    for station, day in samples:
+        record = find_daily_record(path, station, datetime.strptime(day, "%Y%m%d"))
+        records.append(record)
+        daily_record_to_weather(record, datetime.strptime(day, "%Y%m%d"))
+    elapsed = time.perf_counter() - started
+
+    for (station, day), record in zip(samples, records):
+        assert record is not None, f"no record for {station} on {day}"
+        assert [record[column] for column in COLUMNS[2:]] == rows[(station, day)], f"wrong record for {station} on {day}"
+    return elapsed / len(samples) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark KNMI Open Data downloads and lookups.")
+    parser.add_argument("--days", type=int, default=10000, help="Days of data per station in the served file")
+    parser.add_argument("--repeat", type=int, default=5, help="Downloads to time; the fastest is reported")
+    parser.add_argument("--lookups", type=int, default=200, help="Random (station, day) records to look up")
+    parser.add_argument("--serve", action="store_true", help="Only run the stand-in server")
+    parser.add_argument("--port", type=int, default=0, help="Port of the stand-in server (0 picks a free one)")
+    args = parser.parse_args()
+
+    body, rows = make_data_file(args.days)
+    server = StandInServer(body, port=args.port)
+    if args.serve:
+        print(f"Serving {len(body) / 1e6:.1f} MB stand-in dataset; KNMI_BASE_URL={server.base_url}")
+        server.server.serve_forever()
+        return
+
+    server.start()
+    try:
+        download_s, revalidate_s, path, cache_dir = asyncio.run(bench_download(server.base_url, body, args.repeat))
+        try:
+            lookup_us = bench_lookups(path, rows, args.lookups)
+        finally:
+            shutil.rmtree(cache_dir)
+    finally:
+        server.stop()
+
+    megabytes = len(body) / 1e6
+    print(f"{len(STATIONS)} stations x {args.days} days, {megabytes:.1f} MB file")
+    print(f"cold download:  {download_s * 1000:8.1f} ms ({megabytes / download_s:.0f} MB/s, best of {args.repeat})")
+    print(f"revalidation:   {revalidate_s * 1000:8.1f} ms (304 Not Modified)")
+    print(f"record lookup:  {lookup_us:8.1f} µs per lookup ({1e6 / lookup_us:.0f} lookups/s)")
+
+
+if __name__ == "__main__":
+    main()
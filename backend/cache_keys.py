@@ -0,0 +1,70 @@
+import os
+import re
+import unicodedata
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import logging
+
+logger = logging.getLogger(__name__)
+
+# KNMI data is for the Netherlands, so calendar days follow Dutch local time
+try:
+    LOCAL_TIMEZONE = ZoneInfo("Europe/Amsterdam")
+except ZoneInfoNotFoundError:
+    logger.warning("Timezone data for Europe/Amsterdam not found, bucketing dates in UTC")
+    LOCAL_TIMEZONE = ZoneInfo("UTC")
+
+# Within this horizon forecasts are hourly, beyond it they are daily
+HOURLY_BUCKET_HORIZON = timedelta(hours=int(os.getenv("ADVICE_HOURLY_HORIZON_HOURS", 48)))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class AdviceKey(NamedTuple):
+    """
+    Canonical cache key for weather advice. Locations are keyed by their nearest
+    KNMI station rather than raw coordinates, so nearby users share entries.
+    """
+    request_date: datetime
+    activity: str
+    station: int
+
+
+def to_local_time(value: datetime) -> datetime:
+    """
+    Convert a datetime to naive Dutch local time.
+    Naive datetimes are assumed to already be in local time.
+    """
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(LOCAL_TIMEZONE).replace(tzinfo=None)
+
+
+def bucket_request_date(request_date: datetime, now: Optional[datetime] = None) -> datetime:
+    """
+    Round a requested date down to the resolution of the forecast that covers it:
+    the hour for near-term dates, the calendar day for everything else.
+    """
+    local_date = to_local_time(request_date)
+    local_now = to_local_time(now) if now else datetime.now(LOCAL_TIMEZONE).replace(tzinfo=None)
+
+    if abs(local_date - local_now) <= HOURLY_BUCKET_HORIZON:
+        return local_date.replace(minute=0, second=0, microsecond=0)
+    return local_date.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def normalize_activity(activity: str) -> str:
+    """Normalize an activity string so trivially different spellings share a key."""
+    normalized = unicodedata.normalize("NFKC", activity).casefold()
+    return _WHITESPACE.sub(" ", normalized).strip()
+
+
+def make_advice_key(request_date: datetime, activity: str, station: int,
+                    now: Optional[datetime] = None) -> AdviceKey:
+    """Build the canonical cache key for a weather advice request at a KNMI station."""
+    return AdviceKey(
+        request_date=bucket_request_date(request_date, now),
+        activity=normalize_activity(activity),
+        station=station
+    )
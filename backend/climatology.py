@@ -0,0 +1,227 @@
+"""
+Historic climatology index for dates beyond the KNMI forecast horizon.
+
+The index is built offline from KNMI daily station files and stored as a
+float32 array of shape (stations, 366 days of year, fields) in a .npy file,
+with a small JSON sidecar naming the stations and fields. At runtime the
+array is memory-mapped, so loading is instant and lookups are O(1).
+
+Build it from the backend directory:
+
+    python climatology.py etmgeg_260.txt etmgeg_240.txt --output climatology.npy
+"""
+import argparse
+import json
+import os
+import warnings
+from datetime import datetime, date
+from pathlib import Path
+from typing import Dict, Any, Iterable, List, Optional
+import logging
+import numpy as np
+from knmi_open_data import describe_condition
+
+logger = logging.getLogger(__name__)
+
+# Fields stored per station and day of year, in this order
+FIELDS = [
+    "temperature_p10", "temperature_p30", "temperature_p50", "temperature_p70", "temperature_p90",
+    "precipitation_p50", "precipitation_p70", "precipitation_p90", "dry_day_fraction",
+    "wind_p50", "wind_p70", "wind_p90",
+    "humidity_p50",
+    "samples",
+]
+
+# A day with less than this much precipitation (mm) counts as dry
+DRY_DAY_THRESHOLD_MM = 1.0
+
+# Samples from this many days either side of a day of year are pooled together
+DEFAULT_WINDOW_DAYS = 7
+
+# The PRD judges long-range dates as good if 70% of historic data points are;
+# the weather summary therefore uses the value that 70% of days stay below (or above)
+GOOD_DAY_PERCENTILE = 70
+
+DAYS_IN_YEAR = 366
+
+
+def day_of_year_index(value: date) -> int:
+    """Map a date to 0..365, using a leap year so 29 February has its own slot."""
+    return date(2000, value.month, value.day).timetuple().tm_yday - 1
+
+
+class ClimatologyIndex:
+    """Memory-mapped per-station, per-day-of-year climate statistics."""
+
+    def __init__(self, data: np.ndarray, stations: List[int], fields: List[str]):
+        self.data = data
+        self.stations = stations
+        self._station_rows = {station: row for row, station in enumerate(stations)}
+        self._field_columns = {field: column for column, field in enumerate(fields)}
+
+    @classmethod
+    def load(cls, path: str) -> "ClimatologyIndex":
+        """Load an index built by build_index, memory-mapping the array."""
+        data = np.load(path, mmap_mode="r")
+        with open(Path(path).with_suffix(".json")) as meta_file:
+            meta = json.load(meta_file)
+        return cls(data, meta["stations"], meta["fields"])
+
+    def has_station(self, station: int) -> bool:
+        return station in self._station_rows
+
+    def lookup(self, station: int, target_date: datetime) -> Optional[Dict[str, float]]:
+        """Get the statistics for a station and calendar day, or None if unknown."""
+        row = self._station_rows.get(station)
+        if row is None:
+            return None
+        values = self.data[row, day_of_year_index(target_date)]
+        if values[self._field_columns["samples"]] == 0:
+            return None
+        return {field: float(values[column]) for field, column in self._field_columns.items()}
+
+    def get_weather_summary(self, station: int, target_date: datetime) -> Optional[Dict[str, Any]]:
+        """
+        Build a weather summary for a long-range date from historic statistics.
+        Precipitation and wind are the values 70% of historic days stay below; the rules
+        for them only reject on high values, so passing them means passing on at least
+        70% of historic days. Temperature rules go both ways, so the summary carries the
+        typical temperature plus the values 70% of days stay above and below as
+        temperature_low/temperature_high bounds, which the rule engine checks according to
+        each rule's direction.
+        """
+        stats = self.lookup(station, target_date)
+        if stats is None:
+            return None
+
+        # Stations that do not measure a field (e.g. no UG or FG column) have NaN statistics for it
+        stats = {field: None if np.isnan(value) else value for field, value in stats.items()}
+
+        def rounded(field: str, digits: Optional[int] = None) -> Optional[float]:
+            value = stats[field]
+            return None if value is None else round(value, digits)
+
+        temperature = stats["temperature_p50"]
+        temperature_high = stats.get(f"temperature_p{GOOD_DAY_PERCENTILE}", stats["temperature_p90"])
+        precipitation = stats[f"precipitation_p{GOOD_DAY_PERCENTILE}"]
+        weather_data = {
+            "date": target_date.isoformat(),
+            "temperature": rounded("temperature_p50"),
+            "temperature_low": rounded(f"temperature_p{100 - GOOD_DAY_PERCENTILE}", 1),
+            # Indexes built before temperature_p70 was stored fall back to the stricter p90
+            "temperature_high": round(temperature_high, 1) if temperature_high is not None else None,
+            "precipitation_mm": rounded(f"precipitation_p{GOOD_DAY_PERCENTILE}", 1),
+            "wind_speed_kmh": rounded(f"wind_p{GOOD_DAY_PERCENTILE}"),
+            "condition": describe_condition(temperature, precipitation or 0.0),
+            "humidity": rounded("humidity_p50"),
+            "dry_day_fraction": rounded("dry_day_fraction", 2),
+            "temperature_range": [rounded("temperature_p10"), rounded("temperature_p90")]
+            if temperature is not None else None,
+            "station": station,
+            "source": "climatology",
+        }
+        # Leave out fields without history so consumers fall back to their defaults
+        return {key: value for key, value in weather_data.items() if value is not None}
+
+
+def _read_daily_rows(paths: Iterable[str]) -> Dict[int, Dict[str, np.ndarray]]:
+    """Read KNMI daily station files into per-station arrays of day index and measurements."""
+    rows: Dict[int, Dict[str, list]] = {}
+    for path in paths:
+        columns = None
+        with open(path, encoding="latin-1") as data_file:
+            for line in data_file:
+                if line.startswith("#"):
+                    header = line.lstrip("#").strip()
+                    if header.startswith("STN,YYYYMMDD"):
+                        columns = {name.strip(): index for index, name in enumerate(header.split(","))}
+                    continue
+                if columns is None or not line.strip():
+                    continue
+
+                values = [value.strip() for value in line.split(",")]
+                station = int(values[0])
+                day = datetime.strptime(values[1], "%Y%m%d").date()
+                station_rows = rows.setdefault(station, {"doy": [], "TG": [], "RH": [], "FG": [], "UG": []})
+                station_rows["doy"].append(day_of_year_index(day))
+                for column in ("TG", "RH", "FG", "UG"):
+                    raw = values[columns[column]] if column in columns and columns[column] < len(values) else ""
+                    station_rows[column].append(float(raw) if raw else np.nan)
+
+    return {station: {key: np.asarray(value, dtype=float) for key, value in data.items()} for station, data in rows.items()}
+
+
+def build_index(paths: Iterable[str], output: str, window_days: int = DEFAULT_WINDOW_DAYS) -> ClimatologyIndex:
+    """Build the climatology index from KNMI daily station files and write it to output."""
+    rows = _read_daily_rows(paths)
+    stations = sorted(rows)
+    data = np.zeros((len(stations), DAYS_IN_YEAR, len(FIELDS)), dtype=np.float32)
+
+    for row, station in enumerate(stations):
+        station_rows = rows[station]
+        # Convert KNMI units: 0.1 °C, 0.1 mm (-1 means < 0.05 mm), 0.1 m/s
+        temperature = station_rows["TG"] * 0.1
+        precipitation = np.where(station_rows["RH"] == -1, 0.0, station_rows["RH"] * 0.1)
+        wind = station_rows["FG"] * 0.36
+        humidity = station_rows["UG"]
+
+        for day_index in range(DAYS_IN_YEAR):
+            # Circular distance so the window wraps around the turn of the year
+            distance = np.abs(station_rows["doy"] - day_index)
+            in_window = np.minimum(distance, DAYS_IN_YEAR - distance) <= window_days
+            if not in_window.any():
+                continue
+
+            day_precipitation = precipitation[in_window]
+            # Columns a station does not measure are all NaN; their statistics are NaN too
+            with np.errstate(all="ignore"), warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)
+                temperature_percentiles = np.nanpercentile(temperature[in_window], [10, 30, 50, 70, 90])
+                precipitation_percentiles = np.nanpercentile(day_precipitation, [50, 70, 90])
+                wind_percentiles = np.nanpercentile(wind[in_window], [50, 70, 90])
+                humidity_median = np.nanmedian(humidity[in_window])
+            measured = day_precipitation[~np.isnan(day_precipitation)]
+            dry_fraction = float(np.mean(measured < DRY_DAY_THRESHOLD_MM)) if measured.size else np.nan
+
+            data[row, day_index] = np.concatenate([
+                temperature_percentiles,
+                precipitation_percentiles, [dry_fraction],
+                wind_percentiles,
+                [humidity_median],
+                [int(in_window.sum())],
+            ])
+
+    np.save(output, data)
+    with open(Path(output).with_suffix(".json"), "w") as meta_file:
+        json.dump({"stations": stations, "fields": FIELDS, "window_days": window_days}, meta_file)
+
+    logger.info(f"Built climatology index for {len(stations)} stations at {output}")
+    return ClimatologyIndex(data, stations, FIELDS)
+
+
+def load_index(path: str) -> Optional[ClimatologyIndex]:
+    """Load the climatology index if it has been built, otherwise return None."""
+    if not os.path.exists(path):
+        return None
+    try:
+        index = ClimatologyIndex.load(path)
+        logger.info(f"Loaded climatology index for {len(index.stations)} stations from {path}")
+        return index
+    except Exception as e:
+        logger.error(f"Error loading climatology index from {path}: {e}")
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the historic climatology index from KNMI daily station files.")
+    parser.add_argument("files", nargs="+", help="KNMI daily station data files (STN,YYYYMMDD,... format)")
+    parser.add_argument("--output", default="climatology.npy", help="Output .npy file; a .json sidecar is written next to it")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW_DAYS, help="Days either side of each day of year to pool")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    build_index(args.files, args.output, args.window)
+
+
+if __name__ == "__main__":
+    main()
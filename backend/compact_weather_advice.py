@@ -0,0 +1,39 @@
+"""
+One-off maintenance script that removes duplicate weather advice documents.
+
+Before advice was saved with upserts, every cache miss inserted a new document.
+This keeps the newest document per date and activity so the unique index can be
+created. Run it from the backend directory:
+
+    python compact_weather_advice.py
+"""
+import asyncio
+import os
+import logging
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from database import WeatherAdviceDatabase
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def main():
+    mongodb_uri = os.getenv("MONGODB_URI")
+    if not mongodb_uri:
+        raise ValueError("MONGODB_URI environment variable is required")
+    
+    client = AsyncIOMotorClient(mongodb_uri)
+    try:
+        weather_advice_db = WeatherAdviceDatabase(client.sunnydays)
+        deleted = await weather_advice_db.compact_duplicates()
+        await weather_advice_db.create_indexes()
+        logger.info(f"Compaction finished, {deleted} duplicates removed")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,12 +1,95 @@
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
 from models import UserInDB, UserCreate, ActivityInDB, ActivityCreate, ActivityUpdate, WeatherAdviceInDB
-from typing import Optional, List
+from typing import Any, Optional, List, Dict, Tuple
 from bson import ObjectId
-from datetime import datetime, timedelta
+from bson.errors import InvalidId
+from datetime import date, datetime, time, timedelta, timezone
+from cache import LRUTTLCache
+import base64
+import json
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
+# How long generated weather advice is served as fresh
+ADVICE_CACHE_TTL = timedelta(hours=6)
+
+# After ADVICE_CACHE_TTL, advice is served as stale while it is refreshed, up to this age
+ADVICE_STALE_TTL = max(timedelta(hours=float(os.getenv("ADVICE_STALE_TTL_HOURS", 24))), ADVICE_CACHE_TTL)
+
+# Size of the in-process advice cache that sits in front of MongoDB
+ADVICE_MEMORY_CACHE_SIZE = int(os.getenv("ADVICE_MEMORY_CACHE_SIZE", 1024))
+
+# Activity fields read when listing activities; with the computed status, everything
+# ActivityResponse needs and nothing more
+ACTIVITY_LIST_PROJECTION = {"_id": 1, "title": 1, "date": 1, "latitude": 1, "longitude": 1}
+
+# Users whose upcoming activities are looked up per query when prefetching
+UPCOMING_USER_BATCH_SIZE = 1000
+
+# Activities written per insert_many call in a bulk create
+BULK_INSERT_CHUNK_SIZE = 500
+
+# Listing order, matching the (userId, date, _id) index; _id breaks ties between activities on the same date
+ACTIVITY_LIST_SORT = [("date", -1), ("_id", -1)]
+
+
+def activity_status(activity_date: datetime, today: date) -> str:
+    """
+    Determine the status of an activity on a date.
+    The stored status goes stale as days pass, so reads derive it again from the date.
+    Timezone-aware dates are compared by their UTC day, as MongoDB stores them.
+    """
+    if activity_date.tzinfo is not None:
+        activity_date = activity_date.astimezone(timezone.utc).replace(tzinfo=None)
+    if activity_date.date() < today:
+        return "past"
+    return "future"  # Today could be refined based on time
+
+
+def activity_status_expression(today: date) -> Dict[str, Any]:
+    """Aggregation expression computing activity_status from the stored (UTC) date."""
+    return {"$cond": [{"$lt": ["$date", datetime.combine(today, time.min)]}, "past", "future"]}
+
+
+def _with_current_status(activity_doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Replace the stored status of an activity document by the status for today."""
+    activity_doc["status"] = activity_status(activity_doc["date"], datetime.utcnow().date())
+    return activity_doc
+
+
+def activity_doc_to_response(activity_doc: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Turn a projected activity document into the JSON-ready body of an ActivityResponse.
+    Documents written through ActivityInDB are already valid, so they are not validated again.
+    """
+    return {
+        "latitude": activity_doc.get("latitude"),
+        "longitude": activity_doc.get("longitude"),
+        "title": activity_doc["title"],
+        "date": activity_doc["date"],
+        "_id": str(activity_doc["_id"]),
+        "status": activity_doc["status"],
+    }
+
+
+def encode_activity_cursor(date: datetime, activity_id: ObjectId) -> str:
+    """Encode the position after an activity as an opaque page cursor."""
+    position = json.dumps({"date": date.isoformat(), "id": str(activity_id)})
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip("=")
+
+
+def decode_activity_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    """Decode a page cursor from encode_activity_cursor. Raises ValueError if it is malformed."""
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(position["date"]), ObjectId(position["id"])
+    except (ValueError, TypeError, KeyError, InvalidId) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
 
 class UserDatabase:
     """Database operations for users."""
@@ -73,19 +156,13 @@ class ActivityDatabase:
     async def create_activity(self, activity_data: ActivityCreate, user_id: str) -> ActivityInDB:
         """Create a new activity in the database."""
         # Determine activity status based on date
-        today = datetime.utcnow().date()
-        activity_date = activity_data.date.date()
-        
-        if activity_date < today:
-            status = "past"
-        elif activity_date == today:
-            status = "future"  # Could be refined based on time
-        else:
-            status = "future"
+        status = activity_status(activity_data.date, datetime.utcnow().date())
         
         activity_dict = {
             "title": activity_data.title,
             "date": activity_data.date,
+            "latitude": activity_data.latitude,
+            "longitude": activity_data.longitude,
             "userId": ObjectId(user_id),
             "status": status,
         }
@@ -100,18 +177,84 @@ class ActivityDatabase:
         activity_in_db.id = result.inserted_id
         return activity_in_db
     
-    async def get_activities_by_user(self, user_id: str) -> List[ActivityInDB]:
-        """Get all activities for a specific user."""
-        try:
-            object_id = ObjectId(user_id)
-            cursor = self.collection.find({"userId": object_id}).sort("date", -1)
-            activities = []
-            async for activity_doc in cursor:
-                activities.append(ActivityInDB(**activity_doc))
-            return activities
-        except Exception as e:
-            logger.error(f"Error getting activities for user {user_id}: {e}")
-            return []
+    async def create_activities(self, activities: List[ActivityCreate], user_id: str) -> Tuple[List[Dict[str, Any]], List[Tuple[int, str]]]:
+        """
+        Create many activities with unordered insert_many calls of up to BULK_INSERT_CHUNK_SIZE.
+        Returns the created activities as ActivityResponse bodies, in input order, and the
+        position and reason of every activity that could not be written.
+        """
+        now = datetime.utcnow()
+        today = now.date()
+        user_object_id = ObjectId(user_id)
+        activity_docs = [
+            {
+                "_id": ObjectId(),
+                "title": activity_data.title,
+                "date": activity_data.date,
+                "latitude": activity_data.latitude,
+                "longitude": activity_data.longitude,
+                "userId": user_object_id,
+                "status": activity_status(activity_data.date, today),
+                "createdAt": now,
+                "updatedAt": now,
+            }
+            for activity_data in activities
+        ]
+        
+        failed: Dict[int, str] = {}
+        for offset in range(0, len(activity_docs), BULK_INSERT_CHUNK_SIZE):
+            chunk = activity_docs[offset:offset + BULK_INSERT_CHUNK_SIZE]
+            try:
+                # Unordered, so one bad document does not stop the rest of the chunk
+                await self.collection.insert_many(chunk, ordered=False)
+            except BulkWriteError as e:
+                for write_error in e.details.get("writeErrors", []):
+                    failed[offset + write_error["index"]] = write_error.get("errmsg", "Write failed")
+            except Exception as e:
+                logger.error(f"Error inserting activities for user {user_id}: {e}")
+                for position in range(offset, offset + len(chunk)):
+                    failed[position] = "Database error"
+        
+        created = [
+            activity_doc_to_response(activity_doc)
+            for position, activity_doc in enumerate(activity_docs) if position not in failed
+        ]
+        return created, sorted(failed.items())
+    
+    async def get_activity_page(self, user_id: str, limit: Optional[int] = None,
+                                cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Get a user's activities, newest first, a page at a time.
+        Returns up to limit activities as ActivityResponse bodies after the cursor (all of them
+        without a limit) and the cursor of the next page, or None on the last page. Pages are
+        found by seeking in the (userId, date, _id) index rather than skipping, so every page
+        costs the same. Status is computed from the date in the query, never read from storage.
+        Raises ValueError for a malformed cursor.
+        """
+        query = {"userId": ObjectId(user_id)}
+        if cursor is not None:
+            after_date, after_id = decode_activity_cursor(cursor)
+            query["$or"] = [
+                {"date": {"$lt": after_date}},
+                {"date": after_date, "_id": {"$lt": after_id}},
+            ]
+        
+        pipeline = [{"$match": query}, {"$sort": dict(ACTIVITY_LIST_SORT)}]
+        if limit is not None:
+            # One extra document tells whether another page follows
+            pipeline.append({"$limit": limit + 1})
+        pipeline.append({"$project": {
+            **ACTIVITY_LIST_PROJECTION,
+            "status": activity_status_expression(datetime.utcnow().date()),
+        }})
+        
+        activity_docs = [activity_doc async for activity_doc in self.collection.aggregate(pipeline)]
+        next_cursor = None
+        if limit is not None and len(activity_docs) > limit:
+            activity_docs = activity_docs[:limit]
+            next_cursor = encode_activity_cursor(activity_docs[-1]["date"], activity_docs[-1]["_id"])
+        
+        return [activity_doc_to_response(activity_doc) for activity_doc in activity_docs], next_cursor
     
     async def get_activity_by_id(self, activity_id: str, user_id: str) -> Optional[ActivityInDB]:
         """Get a specific activity by ID, ensuring it belongs to the user."""
@@ -123,27 +266,66 @@ class ActivityDatabase:
                 "userId": user_object_id
             })
             if activity_doc:
-                return ActivityInDB(**activity_doc)
+                return ActivityInDB(**_with_current_status(activity_doc))
         except Exception as e:
             logger.error(f"Error getting activity {activity_id} for user {user_id}: {e}")
         return None
     
+    async def get_upcoming_activity_keys(self, start: datetime, end: datetime) -> List[Tuple[datetime, str, Optional[float], Optional[float]]]:
+        """
+        Get the (date, title, latitude, longitude) of every activity between start and end, across all users.
+        User IDs are streamed from the userId index and looked up UPCOMING_USER_BATCH_SIZE at a time,
+        so the date range is answered from the (userId, date, _id) index instead of a collection scan,
+        however many users there are. Dates are naive UTC, as MongoDB returns them.
+        """
+        try:
+            # $sort followed by $group on the indexed field is answered by a scan of distinct index keys
+            user_cursor = self.collection.aggregate([
+                {"$sort": {"userId": 1}},
+                {"$group": {"_id": "$userId"}},
+            ])
+            
+            activities = []
+            user_ids = []
+            async for user_doc in user_cursor:
+                user_ids.append(user_doc["_id"])
+                if len(user_ids) == UPCOMING_USER_BATCH_SIZE:
+                    activities += await self._find_upcoming(user_ids, start, end)
+                    user_ids = []
+            if user_ids:
+                activities += await self._find_upcoming(user_ids, start, end)
+            return activities
+        except Exception as e:
+            logger.error(f"Error getting upcoming activities: {e}")
+            raise
+    
+    async def _find_upcoming(self, user_ids: List[ObjectId], start: datetime,
+                             end: datetime) -> List[Tuple[datetime, str, Optional[float], Optional[float]]]:
+        """Get the upcoming activities of some users."""
+        cursor = self.collection.find(
+            {"userId": {"$in": user_ids}, "date": {"$gte": start, "$lt": end}},
+            {"_id": 0, "date": 1, "title": 1, "latitude": 1, "longitude": 1}
+        ).hint([("userId", 1), ("date", -1), ("_id", -1)])
+        return [
+            (activity_doc["date"], activity_doc["title"], activity_doc.get("latitude"), activity_doc.get("longitude"))
+            async for activity_doc in cursor
+        ]
+    
     async def update_activity(self, activity_id: str, activity_data: ActivityUpdate, user_id: str) -> Optional[ActivityInDB]:
-        """Update an existing activity."""
+        """
+        Update an existing activity in a single round trip.
+        Returns the updated activity, or None if the user has no activity with this ID.
+        """
         try:
             activity_object_id = ObjectId(activity_id)
+        except InvalidId:
+            return None
+        
+        try:
             user_object_id = ObjectId(user_id)
             
             # Determine activity status based on date
-            today = datetime.utcnow().date()
-            activity_date = activity_data.date.date()
-            
-            if activity_date < today:
-                status = "past"
-            elif activity_date == today:
-                status = "future"  # Could be refined based on time
-            else:
-                status = "future"
+            status = activity_status(activity_data.date, datetime.utcnow().date())
             
             update_data = {
                 "title": activity_data.title,
@@ -151,24 +333,38 @@ class ActivityDatabase:
                 "status": status,
                 "updatedAt": datetime.utcnow()
             }
+            # Clients that do not know about locations leave them out; keep the stored one then
+            if activity_data.model_fields_set & {"latitude", "longitude"}:
+                update_data["latitude"] = activity_data.latitude
+                update_data["longitude"] = activity_data.longitude
             
-            result = await self.collection.update_one(
+            # Matching on the user as well keeps other users' activities out of reach; an edit
+            # that changes nothing still matches and returns the activity
+            activity_doc = await self.collection.find_one_and_update(
                 {"_id": activity_object_id, "userId": user_object_id},
-                {"$set": update_data}
+                {"$set": update_data},
+                return_document=ReturnDocument.AFTER
             )
             
-            if result.modified_count > 0:
-                # Return the updated activity
-                return await self.get_activity_by_id(activity_id, user_id)
+            if activity_doc:
+                return ActivityInDB(**_with_current_status(activity_doc))
+            return None
                 
         except Exception as e:
             logger.error(f"Error updating activity {activity_id} for user {user_id}: {e}")
-        return None
+            raise
     
     async def delete_activity(self, activity_id: str, user_id: str) -> bool:
-        """Delete an activity."""
+        """
+        Delete an activity in a single round trip.
+        Returns False if the user has no activity with this ID.
+        """
         try:
             activity_object_id = ObjectId(activity_id)
+        except InvalidId:
+            return False
+        
+        try:
             user_object_id = ObjectId(user_id)
             
             result = await self.collection.delete_one({
@@ -180,14 +376,18 @@ class ActivityDatabase:
             
         except Exception as e:
             logger.error(f"Error deleting activity {activity_id} for user {user_id}: {e}")
-            return False
+            raise
     
     async def create_indexes(self):
         """Create database indexes for optimal performance."""
         # Create index on userId for efficient user-specific queries
         await self.collection.create_index("userId")
-        # Create compound index on userId and date for sorting
-        await self.collection.create_index([("userId", 1), ("date", -1)])
+        # Create compound index on userId, date and _id for sorted, keyset-paginated listing;
+        # it replaces the earlier (userId, date) index, which it covers as a prefix
+        await self.collection.create_index([("userId", 1), ("date", -1), ("_id", -1)])
+        existing = await self.collection.index_information()
+        if "userId_1_date_-1" in existing:
+            await self.collection.drop_index("userId_1_date_-1")
         logger.info("Created indexes for activities collection")
 
 
@@ -197,32 +397,94 @@ class WeatherAdviceDatabase:
     def __init__(self, database: AsyncIOMotorDatabase):
         self.db = database
         self.collection = database.weather_advice
+        # Hot keys are served from memory without a MongoDB round trip
+        self.memory_cache = LRUTTLCache(
+            max_entries=ADVICE_MEMORY_CACHE_SIZE,
+            ttl_seconds=ADVICE_STALE_TTL.total_seconds()
+        )
+    
+    def _remember(self, request_date: datetime, activity: str, station: int, advice: WeatherAdviceInDB) -> None:
+        """Store advice in the memory cache for the rest of its validity window."""
+        age = datetime.utcnow() - advice.created_at
+        remaining = (ADVICE_STALE_TTL - age).total_seconds()
+        self.memory_cache.set((request_date, activity, station), advice, ttl_seconds=remaining)
     
-    async def get_cached_advice(self, request_date: datetime, activity: str) -> Optional[WeatherAdviceInDB]:
-        """Get cached weather advice for a specific date and activity."""
+    async def get_cached_advice(self, request_date: datetime, activity: str, station: int) -> Optional[WeatherAdviceInDB]:
+        """
+        Get cached weather advice for a specific date, activity and KNMI station.
+        Returns advice up to ADVICE_STALE_TTL old; callers decide whether it is still fresh.
+        """
+        cached = self.memory_cache.get((request_date, activity, station))
+        if cached is not None:
+            return cached
+        
         try:
-            # Look for advice created within the last 6 hours for the same date and activity
-            six_hours_ago = datetime.utcnow() - timedelta(hours=6)
+            # Look for the newest advice still within the stale window for the same date, activity and station
+            oldest_allowed = datetime.utcnow() - ADVICE_STALE_TTL
             
             advice_doc = await self.collection.find_one({
                 "request_date": request_date,
                 "activity": activity,
-                "createdAt": {"$gte": six_hours_ago}
-            })
+                "station": station,
+                "createdAt": {"$gte": oldest_allowed}
+            }, sort=[("createdAt", -1)])
             
             if advice_doc:
-                return WeatherAdviceInDB(**advice_doc)
+                advice = WeatherAdviceInDB(**advice_doc)
+                self._remember(request_date, activity, station, advice)
+                return advice
         except Exception as e:
-            logger.error(f"Error getting cached advice for {activity} on {request_date}: {e}")
+            logger.error(f"Error getting cached advice for {activity} on {request_date} at station {station}: {e}")
         return None
     
-    async def save_advice(self, request_date: datetime, activity: str,
+    async def get_cached_advice_many(self, keys: List[Tuple[datetime, str, int]]) -> Dict[Tuple[datetime, str, int], WeatherAdviceInDB]:
+        """
+        Get cached weather advice for many (date, activity, station) keys.
+        Keys not found in memory are resolved with a single MongoDB query.
+        """
+        found: Dict[Tuple[datetime, str, int], WeatherAdviceInDB] = {}
+        remaining = []
+        for key in keys:
+            cached = self.memory_cache.get(key)
+            if cached is not None:
+                found[key] = cached
+            else:
+                remaining.append(key)
+        
+        if not remaining:
+            return found
+        
+        try:
+            oldest_allowed = datetime.utcnow() - ADVICE_STALE_TTL
+            wanted = set(remaining)
+            
+            # The $in filters can over-match on other date/activity/station combinations,
+            # so results are narrowed down to the requested keys below
+            cursor = self.collection.find({
+                "request_date": {"$in": list({date for date, _, _ in remaining})},
+                "activity": {"$in": list({activity for _, activity, _ in remaining})},
+                "station": {"$in": list({station for _, _, station in remaining})},
+                "createdAt": {"$gte": oldest_allowed}
+            }).sort("createdAt", -1)
+            
+            async for advice_doc in cursor:
+                key = (advice_doc["request_date"], advice_doc["activity"], advice_doc["station"])
+                if key in wanted and key not in found:
+                    advice = WeatherAdviceInDB(**advice_doc)
+                    self._remember(*key, advice)
+                    found[key] = advice
+        except Exception as e:
+            logger.error(f"Error getting cached advice for {len(remaining)} keys: {e}")
+        return found
+    
+    async def save_advice(self, request_date: datetime, activity: str, station: int,
                          weather_data_summary: dict, llm_advice: str,
                          llm_explanation: str) -> WeatherAdviceInDB:
         """Save weather advice to the database."""
         advice_dict = {
             "request_date": request_date,
             "activity": activity,
+            "station": station,
             "weather_data_summary": weather_data_summary,
             "llm_advice": llm_advice,
             "llm_explanation": llm_explanation,
@@ -231,19 +493,74 @@ class WeatherAdviceDatabase:
         # Create WeatherAdviceInDB instance to get timestamps
         advice_in_db = WeatherAdviceInDB(**advice_dict)
         
-        # Insert into database
-        result = await self.collection.insert_one(advice_in_db.dict(by_alias=True, exclude={"id"}))
+        # Replace any previous advice for this date, activity and station, keeping one document per key
+        advice_doc = await self.collection.find_one_and_update(
+            {"request_date": request_date, "activity": activity, "station": station},
+            {"$set": advice_in_db.dict(by_alias=True, exclude={"id"})},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
         
-        # Return the created advice with the generated ID
-        advice_in_db.id = result.inserted_id
+        # Return the saved advice with its ID
+        advice_in_db.id = advice_doc["_id"]
+        self._remember(request_date, activity, station, advice_in_db)
         return advice_in_db
     
+    async def compact_duplicates(self) -> int:
+        """
+        Remove duplicate advice documents left over from before saves were upserts.
+        Keeps the newest document for each date, activity and station and returns the number deleted.
+        """
+        pipeline = [
+            {"$sort": {"createdAt": -1}},
+            {"$group": {
+                "_id": {"request_date": "$request_date", "activity": "$activity", "station": "$station"},
+                "ids": {"$push": "$_id"},
+                "count": {"$sum": 1}
+            }},
+            {"$match": {"count": {"$gt": 1}}}
+        ]
+        
+        deleted = 0
+        async for group in self.collection.aggregate(pipeline, allowDiskUse=True):
+            result = await self.collection.delete_many({"_id": {"$in": group["ids"][1:]}})
+            deleted += result.deleted_count
+        
+        logger.info(f"Removed {deleted} duplicate weather advice documents")
+        return deleted
+    
     async def create_indexes(self):
         """Create database indexes for optimal performance."""
-        # Create compound index on request_date and activity for efficient cache lookups
-        await self.collection.create_index([("request_date", 1), ("activity", 1)])
-        # Create index on createdAt for TTL-like queries
-        await self.collection.create_index("createdAt")
+        existing = await self.collection.index_information()
+        
+        # Earlier versions keyed advice without the station, or created indexes without
+        # the unique and TTL options; advice stored without a station expires on its own
+        if "request_date_1_activity_1" in existing:
+            await self.collection.drop_index("request_date_1_activity_1")
+        legacy_created_index = existing.get("createdAt_1")
+        if legacy_created_index and "expireAfterSeconds" not in legacy_created_index:
+            await self.collection.drop_index("createdAt_1")
+        
+        # Create unique compound index on request_date, activity and station so saves upsert a single document
+        try:
+            await self.collection.create_index([("request_date", 1), ("activity", 1), ("station", 1)], unique=True)
+        except (DuplicateKeyError, OperationFailure) as e:
+            if getattr(e, "code", None) != 11000:
+                raise
+            logger.warning("Duplicate weather advice found, compacting before creating unique index")
+            await self.compact_duplicates()
+            await self.collection.create_index([("request_date", 1), ("activity", 1), ("station", 1)], unique=True)
+        
+        # Create TTL index on createdAt so MongoDB removes advice once it is too old to serve
+        expire_after = int(ADVICE_STALE_TTL.total_seconds())
+        ttl_index = existing.get("createdAt_1")
+        if ttl_index and "expireAfterSeconds" in ttl_index and ttl_index["expireAfterSeconds"] != expire_after:
+            await self.db.command(
+                "collMod", self.collection.name,
+                index={"keyPattern": {"createdAt": 1}, "expireAfterSeconds": expire_after}
+            )
+        else:
+            await self.collection.create_index("createdAt", expireAfterSeconds=expire_after)
         logger.info("Created indexes for weather_advice collection")
 
 
@@ -0,0 +1,44 @@
+import httpx
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Connection pool settings shared by all upstream clients
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 20))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", 10))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 60))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "false").lower() == "true"
+
+
+def _http2_available() -> bool:
+    """HTTP/2 support in httpx needs the optional h2 package."""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def create_http_client(base_url: str, timeout_seconds: float) -> httpx.AsyncClient:
+    """
+    Create a long-lived HTTP client for a single upstream.
+    Connections are pooled and kept alive between requests so repeated calls
+    skip the TCP and TLS handshakes.
+    """
+    http2 = HTTP2_ENABLED
+    if http2 and not _http2_available():
+        logger.warning("HTTP2_ENABLED is set but the h2 package is not installed, using HTTP/1.1")
+        http2 = False
+
+    return httpx.AsyncClient(
+        base_url=base_url,
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(timeout_seconds, connect=HTTP_CONNECT_TIMEOUT)
+    )
@@ -0,0 +1,257 @@
+import asyncio
+import httpx
+import json
+import mmap
+import os
+import re
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+from datetime import datetime
+import logging
+from cache import LRUTTLCache, SingleFlight
+from resilience import hedged
+
+logger = logging.getLogger(__name__)
+
+# Files are written to disk in chunks of this size while downloading
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+# How long a dataset file listing is reused before asking KNMI again
+LISTING_TTL_SECONDS = 600
+
+# Index file in the cache directory that records the ETag and size of each downloaded file
+CACHE_INDEX_FILENAME = "index.json"
+
+
+class KNMIOpenDataClient:
+    """
+    Client for the file-based KNMI Open Data API.
+    Dataset files are streamed to a local cache directory and only downloaded
+    again when KNMI reports a different size, modification time or ETag.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, api_key: str, cache_dir: str,
+                 hedge_delay_seconds: Optional[float] = None):
+        self.client = client
+        self.api_key = api_key
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._index_path = self.cache_dir / CACHE_INDEX_FILENAME
+        self._index: Dict[str, Dict[str, Any]] = self._load_index()
+        # Index writes happen in a worker thread; one at a time so they do not share the temp file
+        self._index_lock = asyncio.Lock()
+        self._listings = LRUTTLCache(max_entries=16, ttl_seconds=LISTING_TTL_SECONDS)
+        # Concurrent requests for the same file share one download
+        self._downloading = SingleFlight()
+        # Small metadata requests are retried in parallel if they are slower than this
+        self.hedge_delay_seconds = hedge_delay_seconds
+        self.downloads = 0
+        self.cache_hits = 0
+        self.bytes_downloaded = 0
+
+    def _load_index(self) -> Dict[str, Dict[str, Any]]:
+        """Load the cache index, starting empty if it is missing or unreadable."""
+        try:
+            with open(self._index_path) as index_file:
+                return json.load(index_file)
+        except (OSError, ValueError):
+            return {}
+
+    async def _save_index(self) -> None:
+        """Write the cache index atomically, off the event loop."""
+        async with self._index_lock:
+            # Serialize on the loop, so the index cannot change while it is being written
+            content = json.dumps(self._index)
+            await asyncio.to_thread(self._write_index, content)
+
+    def _write_index(self, content: str) -> None:
+        temp_path = self._index_path.with_suffix(".tmp")
+        with open(temp_path, "w") as index_file:
+            index_file.write(content)
+        os.replace(temp_path, self._index_path)
+
+    def _headers(self) -> Dict[str, str]:
+        return {"Authorization": self.api_key}
+
+    async def _get(self, url: str, **kwargs) -> httpx.Response:
+        """GET an API endpoint, hedged if a hedge delay is configured."""
+        if not self.hedge_delay_seconds:
+            return await self.client.get(url, **kwargs)
+        return await hedged(lambda: self.client.get(url, **kwargs), self.hedge_delay_seconds)
+
+    async def list_files(self, dataset: str, version: str, max_keys: int = 10) -> List[Dict[str, Any]]:
+        """List the most recently modified files of a dataset version."""
+        cache_key = (dataset, version, max_keys)
+        files = self._listings.get(cache_key)
+        if files is not None:
+            return files
+
+        response = await self._get(
+            f"/datasets/{dataset}/versions/{version}/files",
+            headers=self._headers(),
+            params={"maxKeys": max_keys, "orderBy": "lastModified", "sorting": "desc"}
+        )
+        response.raise_for_status()
+
+        files = response.json().get("files", [])
+        self._listings.set(cache_key, files)
+        return files
+
+    async def get_download_url(self, dataset: str, version: str, filename: str) -> str:
+        """Get the temporary download URL of a dataset file."""
+        response = await self._get(
+            f"/datasets/{dataset}/versions/{version}/files/{filename}/url",
+            headers=self._headers()
+        )
+        response.raise_for_status()
+        return response.json()["temporaryDownloadUrl"]
+
+    async def download_file(self, dataset: str, version: str, file_info: Dict[str, Any]) -> Path:
+        """
+        Make sure a dataset file from list_files is in the local cache and return its path.
+        The body is streamed to disk chunk by chunk and never held in memory.
+        """
+        return await self._downloading.do(
+            file_info["filename"],
+            lambda: self._download_file(dataset, version, file_info)
+        )
+
+    async def _download_file(self, dataset: str, version: str, file_info: Dict[str, Any]) -> Path:
+        """Download a dataset file unless the cached copy is still current."""
+        filename = Path(file_info["filename"]).name
+        local_path = self.cache_dir / filename
+        cached = self._index.get(filename)
+
+        # The listing already tells us whether the cached copy is current
+        if cached and local_path.exists() and cached.get("size") == file_info.get("size") \
+                and cached.get("lastModified") == file_info.get("lastModified"):
+            self.cache_hits += 1
+            return local_path
+
+        url = await self.get_download_url(dataset, version, file_info["filename"])
+        headers = {}
+        if cached and local_path.exists() and cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+
+        temp_path = local_path.with_suffix(local_path.suffix + ".part")
+        async with self.client.stream("GET", url, headers=headers) as response:
+            if response.status_code == 304:
+                self.cache_hits += 1
+                cached.update(size=file_info.get("size"), lastModified=file_info.get("lastModified"))
+                await self._save_index()
+                return local_path
+
+            response.raise_for_status()
+            # Disk writes block, so they run in a worker thread instead of stalling other requests
+            output = await asyncio.to_thread(open, temp_path, "wb")
+            try:
+                async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    await asyncio.to_thread(output.write, chunk)
+                    self.bytes_downloaded += len(chunk)
+            finally:
+                await asyncio.to_thread(output.close)
+
+            etag = response.headers.get("ETag")
+
+        await asyncio.to_thread(os.replace, temp_path, local_path)
+        self.downloads += 1
+        self._index[filename] = {
+            "etag": etag,
+            "size": file_info.get("size"),
+            "lastModified": file_info.get("lastModified"),
+        }
+        await self._save_index()
+        logger.info(f"Downloaded KNMI file {filename} to cache")
+        return local_path
+
+    def stats(self) -> Dict[str, Any]:
+        """Return counters for monitoring."""
+        return {
+            "downloads": self.downloads,
+            "cache_hits": self.cache_hits,
+            "bytes_downloaded": self.bytes_downloaded,
+            "cached_files": len(self._index),
+        }
+
+
+def find_daily_record(path: Path, station: int, target_date: datetime) -> Optional[Dict[str, str]]:
+    """
+    Find the row for one station and day in a KNMI daily station data file
+    (comma-separated, with a '# STN,YYYYMMDD,...' header line).
+    The file is memory-mapped and searched in place rather than read or parsed whole.
+    """
+    with open(path, "rb") as data_file:
+        if os.fstat(data_file.fileno()).st_size == 0:
+            return None
+        with mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            header = re.search(rb"^#\s*(STN,YYYYMMDD,[^\r\n]*)", data, re.MULTILINE)
+            if header is None:
+                logger.error(f"KNMI file {path.name} has no daily data header")
+                return None
+            columns = [column.strip() for column in header.group(1).decode().split(",")]
+
+            # Rows look like "  260,20240101,...": find the date column, then check the station
+            day = target_date.strftime("%Y%m%d").encode()
+            needle = b"," + day + b","
+            position = data.find(needle)
+            while position != -1:
+                line_start = data.rfind(b"\n", 0, position) + 1
+                if data[line_start:position].strip() == str(station).encode():
+                    line_end = data.find(b"\n", position)
+                    row = data[position + len(needle):line_end if line_end != -1 else len(data)]
+                    values = [str(station), day.decode()] + [
+                        value.strip() for value in row.decode().rstrip("\r").split(",")
+                    ]
+                    return dict(zip(columns, values))
+                position = data.find(needle, position + 1)
+
+    return None
+
+
+def _scaled(record: Dict[str, str], column: str, scale: float) -> Optional[float]:
+    """Read a numeric KNMI column stored in tenths (or other units) and apply its scale."""
+    value = record.get(column, "").strip()
+    if not value:
+        return None
+    number = int(value)
+    # KNMI uses -1 for amounts below 0.05 (precipitation and sunshine)
+    if number == -1:
+        return 0.0
+    return number * scale
+
+
+def describe_condition(temperature: Optional[float], precipitation: float) -> str:
+    """Derive a coarse weather condition from daily temperature (°C) and precipitation (mm)."""
+    if precipitation > 10:
+        return "snow" if temperature is not None and temperature < 2 else "heavy_rain"
+    if precipitation > 2:
+        return "light_rain"
+    if precipitation > 0:
+        return "drizzle"
+    if temperature is not None and temperature > 20:
+        return "sunny"
+    if temperature is not None and temperature > 10:
+        return "partly_cloudy"
+    return "cloudy"
+
+
+def daily_record_to_weather(record: Dict[str, str], target_date: datetime) -> Dict[str, Any]:
+    """Convert a KNMI daily station record into the weather summary used by the LLM."""
+    temperature = _scaled(record, "TG", 0.1)
+    precipitation = _scaled(record, "RH", 0.1) or 0.0
+    # FG is the daily mean wind speed in 0.1 m/s
+    wind_speed = _scaled(record, "FG", 0.36)
+    humidity = _scaled(record, "UG", 1)
+
+    weather_data = {
+        "date": target_date.isoformat(),
+        "temperature": round(temperature) if temperature is not None else None,
+        "precipitation_mm": round(precipitation, 1),
+        "wind_speed_kmh": round(wind_speed) if wind_speed is not None else None,
+        "condition": describe_condition(temperature, precipitation),
+        "humidity": round(humidity) if humidity is not None else None,
+        "station": int(record["STN"]),
+        "source": "knmi",
+    }
+    # Leave out measurements the station did not report so consumers fall back to their defaults
+    return {key: value for key, value in weather_data.items() if value is not None}
@@ -1,40 +1,223 @@
+import asyncio
 import httpx
 import os
-from typing import Dict, Any, Optional
-from datetime import datetime, date
+from typing import Dict, Any, List, Optional
+from datetime import datetime, date, timedelta
 import logging
+from http_client import create_http_client
+from cache import LRUTTLCache, SingleFlight
+from cache_keys import bucket_request_date, to_local_time
+from knmi_open_data import KNMIOpenDataClient, find_daily_record, daily_record_to_weather
+from climatology import load_index
+from resilience import UpstreamGuard, CircuitOpenError
+from stations import get_station_index
 
 logger = logging.getLogger(__name__)
 
+# KNMI Open Data dataset with daily station data; without it mock data is used
+KNMI_DATASET = os.getenv("KNMI_DATASET")
+KNMI_DATASET_VERSION = os.getenv("KNMI_DATASET_VERSION", "1")
+# Number of most recent dataset files searched for the requested date
+KNMI_DATASET_FILES = int(os.getenv("KNMI_DATASET_FILES", 3))
+KNMI_CACHE_DIR = os.getenv("KNMI_CACHE_DIR", ".knmi_cache")
+# Station used for requests without a location, or too far from any station (260 is De Bilt)
+KNMI_STATION = int(os.getenv("KNMI_STATION", 260))
+
+# Longest a weather lookup may take before falling back, and the delay after which
+# slow KNMI metadata requests are sent a second time (0 disables hedging)
+KNMI_DEADLINE_SECONDS = float(os.getenv("KNMI_DEADLINE_SECONDS", 5))
+KNMI_HEDGE_DELAY_MS = float(os.getenv("KNMI_HEDGE_DELAY_MS", 0))
+
+# Precomputed historic statistics used for dates beyond the forecast horizon
+CLIMATOLOGY_INDEX_PATH = os.getenv("CLIMATOLOGY_INDEX_PATH", "climatology.npy")
+
+# Size of the in-process cache of weather snapshots, shared by all activities
+WEATHER_SNAPSHOT_CACHE_SIZE = int(os.getenv("WEATHER_SNAPSHOT_CACHE_SIZE", 512))
+
+# How long a weather snapshot stays valid, by how far the date is from now.
+# Near-term forecasts change often, observed weather in the past never does.
+NEAR_TERM_HORIZON = timedelta(hours=48)
+FORECAST_HORIZON = timedelta(days=6)
+NEAR_TERM_SNAPSHOT_TTL = timedelta(hours=1)
+FORECAST_SNAPSHOT_TTL = timedelta(hours=3)
+LONG_RANGE_SNAPSHOT_TTL = timedelta(hours=24)
+HISTORIC_SNAPSHOT_TTL = timedelta(days=7)
+
+
+def snapshot_ttl(target_date: datetime, now: Optional[datetime] = None) -> timedelta:
+    """Get the cache lifetime of a weather snapshot based on its forecast horizon."""
+    local_now = to_local_time(now) if now else to_local_time(datetime.now().astimezone())
+    ahead = to_local_time(target_date) - local_now
+    
+    if ahead < -timedelta(days=1):
+        return HISTORIC_SNAPSHOT_TTL
+    if ahead <= NEAR_TERM_HORIZON:
+        return NEAR_TERM_SNAPSHOT_TTL
+    if ahead <= FORECAST_HORIZON:
+        return FORECAST_SNAPSHOT_TTL
+    return LONG_RANGE_SNAPSHOT_TTL
+
 
 class KNMIService:
     """Service for fetching weather data from KNMI API."""
     
     def __init__(self):
         self.api_key = os.getenv("KNMI_API_KEY")
-        self.base_url = "https://api.knmi.nl/open-data/v1"
+        self.base_url = os.getenv("KNMI_BASE_URL", "https://api.dataplatform.knmi.nl/open-data/v1")
+        self.timeout_seconds = float(os.getenv("KNMI_TIMEOUT_SECONDS", 10))
+        # Pooled client shared by all requests, opened in the application lifespan
+        self.client: Optional[httpx.AsyncClient] = None
+        # Weather does not depend on the activity, so snapshots are cached separately from advice
+        self.snapshot_cache = LRUTTLCache(
+            max_entries=WEATHER_SNAPSHOT_CACHE_SIZE,
+            ttl_seconds=HISTORIC_SNAPSHOT_TTL.total_seconds()
+        )
+        self._in_flight = SingleFlight()
+        self._open_data: Optional[KNMIOpenDataClient] = None
+        # Bounds each lookup and stops calling KNMI while it keeps failing
+        self.guard = UpstreamGuard("KNMI", KNMI_DEADLINE_SECONDS)
+        # Memory-mapped, so loading is cheap even for many stations
+        self.climatology = load_index(CLIMATOLOGY_INDEX_PATH)
+    
+    def open_client(self) -> httpx.AsyncClient:
+        """Get the pooled HTTP client for the KNMI API, creating it if needed."""
+        if self.client is None:
+            self.client = create_http_client(self.base_url, self.timeout_seconds)
+        return self.client
+    
+    async def close_client(self) -> None:
+        """Close the pooled HTTP client and its connections."""
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+            self._open_data = None
+    
+    def _get_open_data(self) -> KNMIOpenDataClient:
+        """Get the Open Data file client, which shares the pooled HTTP client."""
+        if self._open_data is None:
+            self._open_data = KNMIOpenDataClient(
+                self.open_client(), self.api_key, KNMI_CACHE_DIR,
+                hedge_delay_seconds=KNMI_HEDGE_DELAY_MS / 1000
+            )
+        return self._open_data
+    
+    def resolve_station(self, latitude: Optional[float] = None, longitude: Optional[float] = None) -> int:
+        """
+        Get the KNMI station used for a location: the nearest station, or KNMI_STATION
+        when no location is given or the location is too far from any station.
+        """
+        if latitude is None or longitude is None:
+            return KNMI_STATION
         
-    async def get_weather_forecast(self, target_date: datetime) -> Optional[Dict[str, Any]]:
+        station = get_station_index().nearest(latitude, longitude)
+        return station.number if station else KNMI_STATION
+    
+    async def get_weather_forecast(self, target_date: datetime, station: int = KNMI_STATION) -> Optional[Dict[str, Any]]:
         """
-        Get weather forecast for a specific date.
+        Get weather forecast for a specific date at a KNMI station.
         Returns a simplified weather summary for the LLM to process.
+        Snapshots are cached per date bucket and station, so all activities there share one fetch.
         """
+        key = (bucket_request_date(target_date), station)
+        
+        weather_data = self.snapshot_cache.get(key)
+        if weather_data is not None:
+            return weather_data
+        
+        return await self._in_flight.do(key, lambda: self._fetch_and_cache_forecast(*key))
+    
+    async def _fetch_and_cache_forecast(self, target_date: datetime, station: int) -> Optional[Dict[str, Any]]:
+        """Fetch the forecast for a date bucket and station and store it in the snapshot cache."""
+        weather_data = await self._fetch_weather_forecast(target_date, station)
+        if weather_data:
+            self.snapshot_cache.set(
+                (target_date, station), weather_data, ttl_seconds=snapshot_ttl(target_date).total_seconds()
+            )
+        return weather_data
+    
+    async def _fetch_weather_forecast(self, target_date: datetime, station: int) -> Optional[Dict[str, Any]]:
+        """Fetch the weather forecast for a date and station from KNMI, bypassing the snapshot cache."""
+        # Forecasts only reach FORECAST_HORIZON ahead; later dates are judged from historic data
+        try:
+            long_range = self._get_long_range_outlook(target_date, station)
+            if long_range:
+                return long_range
+        except Exception as e:
+            # A broken climatology index must not fail the request; fall through to KNMI or mock data
+            logger.error(f"Error reading climatology for station {station} on {target_date.date()}: {e}")
+        
         if not self.api_key:
             logger.warning("KNMI API key not configured, using mock data")
             return self._get_mock_weather_data(target_date)
         
+        if not KNMI_DATASET:
+            logger.warning("KNMI_DATASET not configured, using mock data")
+            return self._get_mock_weather_data(target_date)
+        
+        if not self.guard.is_available():
+            return self._get_mock_weather_data(target_date)
+        
         try:
-            async with httpx.AsyncClient() as client:
-                # For this implementation, we'll use a simplified approach
-                # In a real implementation, you would use the actual KNMI API endpoints
-                # For now, we'll return mock data that represents typical weather information
-                return self._get_mock_weather_data(target_date)
-                
+            weather_data = await self.guard.call(lambda: self._fetch_from_open_data(target_date, station))
+            if weather_data:
+                return weather_data
+            
+            logger.info(f"No KNMI data for station {station} on {target_date.date()} in {KNMI_DATASET}, using mock data")
+            return self._get_mock_weather_data(target_date)
+        
+        except CircuitOpenError:
+            return self._get_mock_weather_data(target_date)
         except Exception as e:
             logger.error(f"Error fetching weather data from KNMI: {e}")
             # Fallback to mock data if API fails
             return self._get_mock_weather_data(target_date)
     
+    def _get_long_range_outlook(self, target_date: datetime, station: int) -> Optional[Dict[str, Any]]:
+        """Get a climatology-based summary for dates beyond the forecast horizon, if available."""
+        if self.climatology is None:
+            return None
+        
+        ahead = to_local_time(target_date) - to_local_time(datetime.now().astimezone())
+        if ahead <= FORECAST_HORIZON:
+            return None
+        
+        return self.climatology.get_weather_summary(station, target_date)
+    
+    async def _fetch_from_open_data(self, target_date: datetime, station: int) -> Optional[Dict[str, Any]]:
+        """Look up a date and station in the most recent files of the configured KNMI dataset."""
+        open_data = self._get_open_data()
+        files = await open_data.list_files(KNMI_DATASET, KNMI_DATASET_VERSION, max_keys=KNMI_DATASET_FILES)
+        
+        for file_info in files:
+            path = await open_data.download_file(KNMI_DATASET, KNMI_DATASET_VERSION, file_info)
+            # Searching the memory-mapped file is blocking I/O, keep it off the event loop
+            record = await asyncio.to_thread(find_daily_record, path, station, target_date)
+            if record:
+                return daily_record_to_weather(record, target_date)
+        return None
+    
+    async def get_weather_window(self, start_date: datetime, days: int,
+                                 station: int = KNMI_STATION) -> List[Dict[str, Any]]:
+        """
+        Get daily weather summaries at a station for a window of consecutive days starting at start_date.
+        The whole window is fetched at once so callers can evaluate it in a single pass;
+        days already in the snapshot cache are not fetched again.
+        """
+        keys = [(bucket_request_date(start_date + timedelta(days=offset)), station) for offset in range(days)]
+        
+        window = [self.snapshot_cache.get(key) for key in keys]
+        missing = [key for key, weather_data in zip(keys, window) if weather_data is None]
+        if not missing:
+            return window
+        
+        fetched = {}
+        for key in missing:
+            target_date, _ = key
+            fetched[key] = await self._fetch_weather_forecast(target_date, station)
+            self.snapshot_cache.set(key, fetched[key], ttl_seconds=snapshot_ttl(target_date).total_seconds())
+        
+        return [weather_data if weather_data is not None else fetched[key] for key, weather_data in zip(keys, window)]
+    
     def _get_mock_weather_data(self, target_date: datetime) -> Dict[str, Any]:
         """
         Generate mock weather data for testing purposes.
@@ -95,6 +278,16 @@ class KNMIService:
             "humidity": random.randint(40, 90),
             "visibility_km": random.randint(5, 20) if precipitation > 0 else random.randint(15, 30)
         }
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return counters for monitoring."""
+        return {
+            "snapshot_cache": self.snapshot_cache.stats(),
+            "in_flight": self._in_flight.stats(),
+            "open_data": self._open_data.stats() if self._open_data else None,
+            "climatology_loaded": self.climatology is not None,
+            "upstream": self.guard.stats(),
+        }
 
 
 # Global service instance
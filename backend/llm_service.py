@@ -1,11 +1,76 @@
+import asyncio
+import bisect
 import httpx
 import os
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, List, NamedTuple, Optional, Tuple
 import logging
 import json
+import re
+from http_client import create_http_client
+from batching import MicroBatcher
+from resilience import UpstreamGuard, UpstreamError, CircuitOpenError
+from rule_engine import get_rule_engine
+from cache import LRUTTLCache
+from cache_keys import normalize_activity
 
 logger = logging.getLogger(__name__)
 
+# Chat model, and whether to ask the provider for a guaranteed JSON object reply
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-3.5-turbo")
+LLM_JSON_MODE = os.getenv("LLM_JSON_MODE", "true").lower() == "true"
+
+# "compact" sends terse key=value prompts under one shared system prompt;
+# "verbose" sends the original full-sentence prompts
+LLM_PROMPT_MODE = os.getenv("LLM_PROMPT_MODE", "compact").lower()
+
+# Shared system prompt for compact mode. It never changes between requests, so providers
+# that cache prompt prefixes can reuse it.
+SYSTEM_PROMPT = (
+    "You are a weather advisor judging if an activity suits the weather, considering safety, comfort and enjoyment. "
+    "Weather fields: t=temperature C, p=precipitation mm, w=wind km/h, c=condition, h=humidity %, v=visibility km, "
+    "d=share of historic days that were dry (only for dates judged from climate history). "
+    "Reply with JSON only. One case: {\"advice\":\"yes\"|\"no\",\"explanation\":\"<=25 words\"}. "
+    "Numbered cases: {\"verdicts\":[{\"id\":n,\"advice\":\"yes\"|\"no\",\"explanation\":\"<=20 words\"}]}. "
+    "Best day (ranked candidate days): {\"summary\":\"<=2 sentences naming the best day and why\"}."
+)
+
+# Weather fields sent in compact prompts, with their short names
+COMPACT_WEATHER_FIELDS = [
+    ("t", "temperature"), ("p", "precipitation_mm"), ("w", "wind_speed_kmh"),
+    ("c", "condition"), ("h", "humidity"), ("v", "visibility_km"), ("d", "dry_day_fraction"),
+]
+
+# Recommendation requests arriving within this window are sent to the LLM as one prompt
+LLM_BATCH_WINDOW_MS = float(os.getenv("LLM_BATCH_WINDOW_MS", 10))
+LLM_BATCH_MAX_SIZE = int(os.getenv("LLM_BATCH_MAX_SIZE", 8))
+
+# Longest a single LLM call may take before falling back to rule-based advice
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", 8))
+
+# Recognized activities whose rule-based verdict is at least this far (in rule engine
+# margin units) from flipping are answered without the LLM; above 10 every case goes to the LLM
+LLM_ROUTING_MARGIN = float(os.getenv("LLM_ROUTING_MARGIN", 0.5))
+
+# LLM verdicts are reused for equivalent situations: same weather bands, condition and
+# activity category. Band edges line up with the rule engine thresholds.
+LLM_MEMO_SIZE = int(os.getenv("LLM_MEMO_SIZE", 2048))
+LLM_MEMO_TTL_HOURS = float(os.getenv("LLM_MEMO_TTL_HOURS", 24))
+TEMPERATURE_BAND_C = 5
+# Stands in for the activity in remembered explanations, so they can be reused for
+# other activities of the same category
+ACTIVITY_PLACEHOLDER = "{activity}"
+PRECIPITATION_BAND_EDGES_MM = [0.1, 1, 5, 10, 20, 30]
+WIND_BAND_EDGES_KMH = [10, 20, 25, 30, 40]
+
+
+class Recommendation(NamedTuple):
+    """An activity recommendation and where it came from."""
+    advice: str
+    explanation: str
+    # "llm"; "rules" when the rules were chosen on purpose (no API key, clear-cut case);
+    # "fallback" when the rules stood in for an LLM that failed or was unavailable
+    source: str
+
 
 class LLMService:
     """Service for getting weather-based activity recommendations from an LLM."""
@@ -15,70 +80,343 @@ class LLMService:
         # For this implementation, we'll use OpenAI's API as an example
         # You can easily adapt this to use other LLM providers
         self.base_url = "https://api.openai.com/v1"
-        
-    async def get_activity_recommendation(self, weather_data: Dict[str, Any], activity: str) -> Tuple[str, str]:
+        self.timeout_seconds = float(os.getenv("LLM_TIMEOUT_SECONDS", 30))
+        # Pooled client shared by all requests, opened in the application lifespan
+        self.client: Optional[httpx.AsyncClient] = None
+        # Concurrent recommendation requests are grouped into one prompt (disabled if max size is 1)
+        self._batcher: Optional[MicroBatcher] = None
+        if LLM_BATCH_MAX_SIZE > 1:
+            self._batcher = MicroBatcher(
+                self._get_llm_recommendations_batch,
+                max_batch_size=LLM_BATCH_MAX_SIZE,
+                max_wait_seconds=LLM_BATCH_WINDOW_MS / 1000
+            )
+        self.batch_fallbacks = 0
+        # Bounds each call and stops calling the LLM while it keeps failing
+        self.guard = UpstreamGuard("LLM", LLM_DEADLINE_SECONDS)
+        # How recommendation requests were routed, for monitoring
+        self.routing = {"rules_confident": 0, "llm_ambiguous": 0, "llm_unknown_activity": 0}
+        # Earlier LLM verdicts by quantized situation, shared across dates and users
+        self.verdict_memo = LRUTTLCache(max_entries=LLM_MEMO_SIZE, ttl_seconds=LLM_MEMO_TTL_HOURS * 3600)
+        # Token usage reported by the provider
+        self.token_usage = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    
+    def open_client(self) -> httpx.AsyncClient:
+        """Get the pooled HTTP client for the LLM API, creating it if needed."""
+        if self.client is None:
+            self.client = create_http_client(self.base_url, self.timeout_seconds)
+        return self.client
+    
+    async def close_client(self) -> None:
+        """Close the pooled HTTP client and its connections."""
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+    
+    async def get_activity_recommendation(self, weather_data: Dict[str, Any], activity: str) -> Recommendation:
         """
         Get a recommendation for whether an activity is suitable given the weather conditions.
-        Returns a tuple of (advice: "yes"|"no", explanation: str)
+        Returns a Recommendation of (advice: "yes"|"no", explanation: str, source); callers
+        should not keep "fallback" recommendations as long as LLM ones.
         """
         if not self.api_key:
             logger.warning("LLM API key not configured, using rule-based recommendations")
-            return self._get_rule_based_recommendation(weather_data, activity)
+            return Recommendation(*self._get_rule_based_recommendation(weather_data, activity), "rules")
+        
+        # Clear-cut cases for known activities do not need the LLM
+        rule_engine = get_rule_engine()
+        category = rule_engine.classify(activity)
+        verdict = rule_engine.evaluate([weather_data], category)[0]
+        if category is None:
+            self.routing["llm_unknown_activity"] += 1
+        elif verdict.margin >= LLM_ROUTING_MARGIN:
+            self.routing["rules_confident"] += 1
+            return Recommendation(verdict.advice, verdict.explanation, "rules")
+        else:
+            self.routing["llm_ambiguous"] += 1
+        
+        memoized = self._recall_verdict(weather_data, activity)
+        if memoized is not None:
+            return memoized
+        
+        if not self.guard.is_available():
+            return Recommendation(verdict.advice, verdict.explanation, "fallback")
+        
+        try:
+            if self._batcher is not None:
+                return await self._batcher.submit((weather_data, activity))
+            return await self._get_llm_recommendation(weather_data, activity)
+        
+        except CircuitOpenError:
+            return self._get_fallback_recommendation(weather_data, activity)
+        except Exception as e:
+            logger.error(f"Error getting LLM recommendation: {e}")
+            return self._get_fallback_recommendation(weather_data, activity)
+    
+    async def _get_llm_recommendation(self, weather_data: Dict[str, Any], activity: str) -> Recommendation:
+        """Ask the LLM for a single recommendation, falling back to rules if the reply is unusable."""
+        # Prepare the prompt for the LLM
+        if LLM_PROMPT_MODE == "compact":
+            system_prompt, prompt, max_tokens = SYSTEM_PROMPT, self._create_compact_prompt(weather_data, activity), 80
+        else:
+            system_prompt = "You are a weather advisor. Respond with a JSON object containing 'advice' (either 'yes' or 'no') and 'explanation' (a brief reason for your recommendation)."
+            prompt, max_tokens = self._create_prompt(weather_data, activity), 150
         
+        content = await self._chat_completion(
+            system_prompt=system_prompt,
+            prompt=prompt,
+            max_tokens=max_tokens
+        )
+        if content is None:
+            return self._get_fallback_recommendation(weather_data, activity)
+        
+        # Parse the JSON response
         try:
-            # Prepare the prompt for the LLM
-            prompt = self._create_prompt(weather_data, activity)
+            parsed = json.loads(content)
+            advice = parsed.get("advice", "no").lower()
+            explanation = parsed.get("explanation", "Unable to determine recommendation")
+            
+            # Ensure advice is either "yes" or "no"
+            if advice not in ["yes", "no"]:
+                advice = "no"
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": "gpt-3.5-turbo",
-                        "messages": [
-                            {
-                                "role": "system",
-                                "content": "You are a weather advisor. Respond with a JSON object containing 'advice' (either 'yes' or 'no') and 'explanation' (a brief reason for your recommendation)."
-                            },
-                            {
-                                "role": "user",
-                                "content": prompt
-                            }
-                        ],
-                        "max_tokens": 150,
-                        "temperature": 0.3
-                    },
-                    timeout=30.0
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    content = result["choices"][0]["message"]["content"]
-                    
-                    # Parse the JSON response
-                    try:
-                        parsed = json.loads(content)
-                        advice = parsed.get("advice", "no").lower()
-                        explanation = parsed.get("explanation", "Unable to determine recommendation")
-                        
-                        # Ensure advice is either "yes" or "no"
-                        if advice not in ["yes", "no"]:
-                            advice = "no"
-                            
-                        return advice, explanation
-                    except json.JSONDecodeError:
-                        logger.error(f"Failed to parse LLM response: {content}")
-                        return self._get_rule_based_recommendation(weather_data, activity)
-                else:
-                    logger.error(f"LLM API request failed with status {response.status_code}")
-                    return self._get_rule_based_recommendation(weather_data, activity)
-                    
+            self._remember_verdict(weather_data, activity, advice, explanation)
+            return Recommendation(advice, explanation, "llm")
+        except json.JSONDecodeError:
+            logger.error(f"Failed to parse LLM response: {content}")
+            return self._get_fallback_recommendation(weather_data, activity)
+    
+    async def _get_llm_recommendations_batch(self, jobs: List[Tuple[Dict[str, Any], str]]) -> List[Recommendation]:
+        """
+        Ask the LLM for several recommendations in one prompt.
+        Falls back to one call per job if the combined reply cannot be parsed.
+        """
+        if len(jobs) == 1:
+            return [await self._get_llm_recommendation(*jobs[0])]
+        
+        if LLM_PROMPT_MODE == "compact":
+            system_prompt, prompt, max_tokens = SYSTEM_PROMPT, self._create_compact_batch_prompt(jobs), 60 * len(jobs)
+        else:
+            system_prompt = "You are a weather advisor. Respond with a JSON object containing 'verdicts': an array with one object per case, each with 'id', 'advice' (either 'yes' or 'no') and 'explanation' (a brief reason for your recommendation)."
+            prompt, max_tokens = self._create_batch_prompt(jobs), 150 * len(jobs)
+        
+        verdicts = None
+        try:
+            content = await self._chat_completion(
+                system_prompt=system_prompt,
+                prompt=prompt,
+                max_tokens=max_tokens
+            )
+            if content is not None:
+                verdicts = self._parse_batch_verdicts(content, len(jobs))
+        except Exception as e:
+            logger.error(f"Error getting batched LLM recommendations: {e}")
+        
+        if verdicts is not None:
+            for job, verdict in zip(jobs, verdicts):
+                self._remember_verdict(*job, *verdict)
+            return [Recommendation(*verdict, "llm") for verdict in verdicts]
+        
+        if not self.guard.is_available():
+            return [self._get_fallback_recommendation(*job) for job in jobs]
+        
+        self.batch_fallbacks += 1
+        logger.warning(f"Falling back to single LLM calls for a batch of {len(jobs)}")
+        return await asyncio.gather(*(self._get_single_recommendation_or_rules(*job) for job in jobs))
+    
+    async def _get_single_recommendation_or_rules(self, weather_data: Dict[str, Any], activity: str) -> Recommendation:
+        """Single LLM recommendation that never raises, so one failure does not sink a batch."""
+        try:
+            return await self._get_llm_recommendation(weather_data, activity)
         except Exception as e:
             logger.error(f"Error getting LLM recommendation: {e}")
-            return self._get_rule_based_recommendation(weather_data, activity)
+            return self._get_fallback_recommendation(weather_data, activity)
+    
+    def _memo_key(self, weather_data: Dict[str, Any], activity: str) -> Tuple:
+        """
+        Key for the verdict memo: weather quantized into bands plus the activity category.
+        Unrecognized activities have no category and are keyed by their normalized text.
+        """
+        temperature = weather_data.get('temperature', 15)
+        precipitation = weather_data.get('precipitation_mm', 0)
+        wind_speed = weather_data.get('wind_speed_kmh', 10)
+        category = get_rule_engine().classify(activity)
+        return (
+            int(temperature // TEMPERATURE_BAND_C),
+            bisect.bisect_right(PRECIPITATION_BAND_EDGES_MM, precipitation),
+            bisect.bisect_right(WIND_BAND_EDGES_KMH, wind_speed),
+            weather_data.get('condition', 'unknown'),
+            category if category is not None else normalize_activity(activity),
+        )
+    
+    def _remember_verdict(self, weather_data: Dict[str, Any], activity: str, advice: str, explanation: str) -> None:
+        """
+        Memoize an LLM verdict. Mentions of the activity (the whole phrase, or the
+        category keywords in it, e.g. "hiking" in "hiking trip") are replaced by
+        ACTIVITY_PLACEHOLDER, so the explanation fits any activity it is served to.
+        """
+        activity = normalize_activity(activity)
+        for name in [activity, *get_rule_engine().keywords(activity)]:
+            explanation = re.sub(rf"\b{re.escape(name)}\b", ACTIVITY_PLACEHOLDER, explanation, flags=re.IGNORECASE)
+        self.verdict_memo.set(self._memo_key(weather_data, activity), (advice, explanation))
+    
+    def _recall_verdict(self, weather_data: Dict[str, Any], activity: str) -> Optional[Recommendation]:
+        """Get a memoized LLM verdict for an equivalent situation, naming this activity."""
+        memoized = self.verdict_memo.get(self._memo_key(weather_data, activity))
+        if memoized is None:
+            return None
+        advice, explanation = memoized
+        return Recommendation(advice, explanation.replace(ACTIVITY_PLACEHOLDER, normalize_activity(activity)), "llm")
+    
+    def _parse_batch_verdicts(self, content: str, expected: int) -> Optional[List[Tuple[str, str]]]:
+        """Parse a batched reply into (advice, explanation) pairs, or None if it is incomplete."""
+        try:
+            parsed = json.loads(content)
+            by_id = {}
+            for verdict in parsed.get("verdicts", []):
+                advice = str(verdict.get("advice", "no")).lower()
+                # Ensure advice is either "yes" or "no"
+                if advice not in ["yes", "no"]:
+                    advice = "no"
+                by_id[int(verdict["id"])] = (advice, verdict.get("explanation", "Unable to determine recommendation"))
+        except (json.JSONDecodeError, AttributeError, KeyError, TypeError, ValueError):
+            logger.error(f"Failed to parse batched LLM response: {content}")
+            return None
+        
+        if any(case_id not in by_id for case_id in range(1, expected + 1)):
+            logger.error(f"Batched LLM response is missing verdicts: {content}")
+            return None
+        return [by_id[case_id] for case_id in range(1, expected + 1)]
+    
+    async def get_best_day_summary(self, candidates: List[Dict[str, Any]], activity: str) -> str:
+        """
+        Get a short explanation of which of the top-ranked candidate days is best for an activity.
+        Each candidate has 'date', 'advice', 'score' and 'weather' keys. Only this short list is
+        sent to the LLM, never the full window.
+        """
+        if not candidates:
+            return f"No suitable days found for {activity} in the requested period."
+        
+        if not self.api_key or not self.guard.is_available():
+            return self._get_rule_based_best_day_summary(candidates, activity)
+        
+        if LLM_PROMPT_MODE == "compact":
+            system_prompt, prompt = SYSTEM_PROMPT, self._create_compact_best_day_prompt(candidates, activity)
+        else:
+            system_prompt = "You are a weather advisor. Respond with a JSON object containing 'summary' (at most two sentences naming the best day and why)."
+            prompt = self._create_best_day_prompt(candidates, activity)
+        
+        try:
+            content = await self._chat_completion(
+                system_prompt=system_prompt,
+                prompt=prompt,
+                max_tokens=120
+            )
+            if content is None:
+                return self._get_rule_based_best_day_summary(candidates, activity)
+            
+            try:
+                summary = json.loads(content).get("summary")
+                if summary:
+                    return summary
+            except json.JSONDecodeError:
+                logger.error(f"Failed to parse LLM response: {content}")
+            return self._get_rule_based_best_day_summary(candidates, activity)
+        
+        except Exception as e:
+            logger.error(f"Error getting LLM best day summary: {e}")
+            return self._get_rule_based_best_day_summary(candidates, activity)
+    
+    async def _chat_completion(self, system_prompt: str, prompt: str, max_tokens: int) -> Optional[str]:
+        """
+        Send a chat completion request and return the message content, or None on failure.
+        Raises CircuitOpenError or a timeout when the call is cut short by the upstream guard.
+        """
+        client = self.open_client()
+        payload = {
+            "model": LLM_MODEL,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": system_prompt
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            "max_tokens": max_tokens,
+            "temperature": 0.3
+        }
+        if LLM_JSON_MODE:
+            # The provider then only returns syntactically valid JSON objects
+            payload["response_format"] = {"type": "json_object"}
+        
+        async def post() -> httpx.Response:
+            response = await client.post(
+                "/chat/completions",
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json"
+                },
+                json=payload
+            )
+            # Overload and server errors count against the circuit breaker
+            if response.status_code == 429 or response.status_code >= 500:
+                raise UpstreamError(f"LLM API returned status {response.status_code}")
+            return response
+        
+        try:
+            response = await self.guard.call(post)
+        except UpstreamError as e:
+            logger.error(str(e))
+            return None
+        
+        if response.status_code == 200:
+            result = response.json()
+            self._record_usage(result.get("usage"))
+            return result["choices"][0]["message"]["content"]
+        
+        logger.error(f"LLM API request failed with status {response.status_code}")
+        return None
+    
+    def _record_usage(self, usage: Optional[Dict[str, Any]]) -> None:
+        """Add the token counts of one request to the usage totals."""
+        self.token_usage["requests"] += 1
+        if not usage:
+            return
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+        self.token_usage["prompt_tokens"] += prompt_tokens
+        self.token_usage["completion_tokens"] += completion_tokens
+        logger.debug(f"LLM request used {prompt_tokens} prompt and {completion_tokens} completion tokens")
+    
+    def _format_compact_weather(self, weather_data: Dict[str, Any]) -> str:
+        """Format weather as terse key=value pairs, leaving out unreported fields."""
+        return " ".join(
+            f"{short}={weather_data[field]}" for short, field in COMPACT_WEATHER_FIELDS if weather_data.get(field) is not None
+        )
+    
+    def _create_compact_prompt(self, weather_data: Dict[str, Any], activity: str) -> str:
+        """Create a compact single-case prompt for use with SYSTEM_PROMPT."""
+        return f"activity={json.dumps(activity)} {self._format_compact_weather(weather_data)}"
+    
+    def _create_compact_batch_prompt(self, jobs: List[Tuple[Dict[str, Any], str]]) -> str:
+        """Create a compact prompt with one numbered line per (weather, activity) case."""
+        return "\n".join(
+            f"{case_id} activity={json.dumps(activity)} {self._format_compact_weather(weather_data)}"
+            for case_id, (weather_data, activity) in enumerate(jobs, start=1)
+        )
+    
+    def _create_compact_best_day_prompt(self, candidates: List[Dict[str, Any]], activity: str) -> str:
+        """Create a compact best-day prompt listing the top-ranked candidate days."""
+        lines = [f"best day for activity={json.dumps(activity)}"]
+        for candidate in candidates:
+            lines.append(
+                f"{candidate['date']} {self._format_compact_weather(candidate['weather'])} "
+                f"rule={candidate['advice']} score={candidate['score']:.2f}"
+            )
+        return "\n".join(lines)
     
     def _create_prompt(self, weather_data: Dict[str, Any], activity: str) -> str:
         """Create a prompt for the LLM based on weather data and activity."""
@@ -100,69 +438,103 @@ Please provide your recommendation as a JSON object with:
 Consider safety, comfort, and enjoyment when making your recommendation.
         """.strip()
     
+    def _create_batch_prompt(self, jobs: List[Tuple[Dict[str, Any], str]]) -> str:
+        """Create one prompt covering several (weather, activity) cases."""
+        cases = []
+        for case_id, (weather_data, activity) in enumerate(jobs, start=1):
+            cases.append(
+                f'{case_id}. Activity: "{activity}"; '
+                f"temperature {weather_data.get('temperature', 'unknown')}°C, "
+                f"precipitation {weather_data.get('precipitation_mm', 'unknown')}mm, "
+                f"wind {weather_data.get('wind_speed_kmh', 'unknown')} km/h, "
+                f"condition {weather_data.get('condition', 'unknown')}, "
+                f"humidity {weather_data.get('humidity', 'unknown')}%, "
+                f"visibility {weather_data.get('visibility_km', 'unknown')} km"
+            )
+        case_lines = "\n".join(cases)
+        return f"""
+For each numbered case, should the activity be done in the given weather?
+
+{case_lines}
+
+Respond with a JSON object {{"verdicts": [...]}} containing one entry per case with:
+- "id": the case number
+- "advice": either "yes" or "no"
+- "explanation": a brief explanation of your reasoning (max 60 words)
+
+Consider safety, comfort, and enjoyment when making your recommendation.
+        """.strip()
+    
+    def _create_best_day_prompt(self, candidates: List[Dict[str, Any]], activity: str) -> str:
+        """Create a short prompt describing the top-ranked candidate days."""
+        lines = []
+        for candidate in candidates:
+            weather = candidate["weather"]
+            lines.append(
+                f"- {candidate['date']}: {weather.get('temperature', 'unknown')}°C, "
+                f"{weather.get('precipitation_mm', 'unknown')}mm, "
+                f"{weather.get('wind_speed_kmh', 'unknown')} km/h, "
+                f"{weather.get('condition', 'unknown')}, "
+                f"rule verdict {candidate['advice']}, score {candidate['score']:.2f}"
+            )
+        candidate_lines = "\n".join(lines)
+        return f"""
+These are the highest-ranked days for the activity "{activity}":
+{candidate_lines}
+
+Pick the best day and explain why in a JSON object with a "summary" field.
+        """.strip()
+    
+    def _get_rule_based_best_day_summary(self, candidates: List[Dict[str, Any]], activity: str) -> str:
+        """Summarize the top candidate without an LLM."""
+        best = candidates[0]
+        if best["advice"] == "yes":
+            return f"{best['date']} is the best day for {activity}. {best['explanation']}"
+        return f"None of the days look suitable for {activity}; {best['date']} is the least bad option. {best['explanation']}"
+    
+    def get_rule_based_recommendation(self, weather_data: Dict[str, Any], activity: str) -> Tuple[str, str]:
+        """Get the immediate rule-based recommendation without contacting the LLM."""
+        return self._get_rule_based_recommendation(weather_data, activity)
+    
+    def _get_fallback_recommendation(self, weather_data: Dict[str, Any], activity: str) -> Recommendation:
+        """Rule-based recommendation standing in for an LLM verdict that could not be obtained."""
+        return Recommendation(*self._get_rule_based_recommendation(weather_data, activity), "fallback")
+    
     def _get_rule_based_recommendation(self, weather_data: Dict[str, Any], activity: str) -> Tuple[str, str]:
         """
         Fallback rule-based recommendation system when LLM is not available.
         This provides basic weather-based activity recommendations.
         """
-        temperature = weather_data.get('temperature', 15)
-        precipitation = weather_data.get('precipitation_mm', 0)
-        wind_speed = weather_data.get('wind_speed_kmh', 10)
-        condition = weather_data.get('condition', 'unknown')
-        
-        activity_lower = activity.lower()
-        
-        # Define activity categories and their weather requirements
-        outdoor_activities = ['hiking', 'cycling', 'running', 'walking', 'picnic', 'camping', 'gardening', 'sports']
-        water_activities = ['swimming', 'sailing', 'surfing', 'fishing', 'kayaking']
-        winter_activities = ['skiing', 'snowboarding', 'ice skating', 'sledding']
-        indoor_activities = ['shopping', 'museum', 'cinema', 'reading', 'cooking', 'studying']
-        
-        # Check if activity matches any category
-        is_outdoor = any(keyword in activity_lower for keyword in outdoor_activities)
-        is_water = any(keyword in activity_lower for keyword in water_activities)
-        is_winter = any(keyword in activity_lower for keyword in winter_activities)
-        is_indoor = any(keyword in activity_lower for keyword in indoor_activities)
-        
-        # Rule-based logic
-        if is_indoor:
-            return "yes", "Indoor activities are generally not affected by weather conditions."
-        
-        if is_winter:
-            if temperature < 5 and condition in ['snow', 'cloudy']:
-                return "yes", "Good conditions for winter activities with cold temperatures."
-            else:
-                return "no", "Winter activities require colder temperatures and preferably snow."
-        
-        if is_water:
-            if temperature < 15:
-                return "no", "Water activities are not recommended in cold temperatures."
-            elif precipitation > 20:
-                return "no", "Heavy precipitation makes water activities unsafe."
-            elif wind_speed > 25:
-                return "no", "Strong winds make water activities dangerous."
-            else:
-                return "yes", "Good conditions for water activities."
-        
-        if is_outdoor:
-            if precipitation > 30:
-                return "no", "Heavy rain makes outdoor activities unpleasant and potentially unsafe."
-            elif wind_speed > 30:
-                return "no", "Very strong winds make outdoor activities difficult and unsafe."
-            elif temperature < -5:
-                return "no", "Extremely cold temperatures make outdoor activities uncomfortable."
-            elif temperature > 35:
-                return "no", "Very high temperatures can be dangerous for outdoor activities."
-            elif precipitation > 10:
-                return "no", "Light to moderate rain makes outdoor activities less enjoyable."
-            else:
-                return "yes", f"Good weather conditions for outdoor activities. Temperature: {temperature}°C, minimal precipitation."
-        
-        # Default recommendation for unclassified activities
-        if precipitation > 20 or wind_speed > 25:
-            return "no", "Weather conditions may not be suitable for this activity."
-        else:
-            return "yes", "Weather conditions appear suitable for this activity."
+        verdict = get_rule_engine().recommend(weather_data, activity)
+        return verdict.advice, verdict.explanation
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return counters for monitoring."""
+        return {
+            "batching": self._batcher.stats() if self._batcher else None,
+            "batch_fallbacks": self.batch_fallbacks,
+            "upstream": self.guard.stats(),
+            "routing": dict(self.routing),
+            "verdict_memo": self.verdict_memo.stats(),
+            "prompt_mode": LLM_PROMPT_MODE,
+            "token_usage": {
+                **self.token_usage,
+                "average_prompt_tokens": round(self.token_usage["prompt_tokens"] / self.token_usage["requests"], 1)
+                if self.token_usage["requests"] else 0.0,
+                "average_completion_tokens": round(self.token_usage["completion_tokens"] / self.token_usage["requests"], 1)
+                if self.token_usage["requests"] else 0.0,
+            },
+        }
+    
+    def get_window_recommendations(self, weather_window: List[Dict[str, Any]], activity: str) -> List[Tuple[str, str, float]]:
+        """
+        Rule-based recommendations for a whole window of weather samples at once,
+        with a 0-1 suitability score for ranking.
+        Returns a list of (advice, explanation, score) in the order of weather_window.
+        """
+        rule_engine = get_rule_engine()
+        verdicts = rule_engine.evaluate(weather_window, rule_engine.classify(activity))
+        return [(verdict.advice, verdict.explanation, verdict.score) for verdict in verdicts]
 
 
 # Global service instance
@@ -171,4 +543,4 @@ llm_service = LLMService()
 
 def get_llm_service() -> LLMService:
     """Get the LLM service instance."""
-    return llm_service
\ No newline at end of file
+    return llm_service
@@ -1,5 +1,6 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 from contextlib import asynccontextmanager
@@ -12,6 +13,9 @@ from auth_router import router as auth_router
 from activities_router import router as activities_router
 from weather_advice_router import router as weather_advice_router
 from database import init_user_database, init_activity_database, init_weather_advice_database
+from knmi_service import get_knmi_service
+from llm_service import get_llm_service
+from prefetcher import get_advice_prefetcher
 
 # Load environment variables from .env file
 load_dotenv()
@@ -65,9 +69,23 @@ async def lifespan(app: FastAPI):
         logger.error(f"Failed to connect to MongoDB: {e}")
         raise
     
+    # Open pooled HTTP clients for the upstream weather and LLM APIs
+    get_knmi_service().open_client()
+    get_llm_service().open_client()
+    logger.info("Upstream HTTP clients initialized")
+    
+    # Warm the advice caches for upcoming activities in the background
+    get_advice_prefetcher().start()
+    
     yield
     
     # Shutdown
+    await get_advice_prefetcher().stop()
+    
+    await get_knmi_service().close_client()
+    await get_llm_service().close_client()
+    logger.info("Upstream HTTP clients closed")
+    
     if db_client:
         db_client.close()
         logger.info("MongoDB connection closed")
@@ -78,6 +96,8 @@ app = FastAPI(
     title="SunnyDays API",
     description="Weather recommendation engine backend",
     version="1.0.0",
+    # orjson encodes responses several times faster than the standard json module
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -89,6 +109,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets browser clients read the cursor of the next activities page
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Include routers
@@ -5,12 +5,17 @@ from models import UserInDB
 from auth_utils import verify_token
 from database import get_user_database
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
 # HTTP Bearer token scheme
 security = HTTPBearer()
 
+# Users allowed to see operational endpoints such as the weather advice stats;
+# with none configured those endpoints are closed to everyone
+OPERATOR_EMAILS = {email.strip().lower() for email in os.getenv("OPERATOR_EMAILS", "").split(",") if email.strip()}
+
 
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security)
@@ -83,4 +88,17 @@ def require_auth(user: UserInDB = Depends(get_current_user)) -> UserInDB:
     Dependency that requires authentication.
     Use this as a dependency in routes that need authentication.
     """
+    return user
+
+
+def require_operator(user: UserInDB = Depends(require_auth)) -> UserInDB:
+    """
+    Dependency that requires an authenticated user listed in OPERATOR_EMAILS.
+    Use this for routes that expose internal state.
+    """
+    if user.email.lower() not in OPERATOR_EMAILS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Operator access required"
+        )
     return user
\ No newline at end of file
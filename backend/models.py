@@ -1,7 +1,8 @@
-from pydantic import BaseModel, EmailStr, Field
-from typing import Optional
+from pydantic import BaseModel, EmailStr, Field, model_validator
+from typing import Optional, List
 from datetime import datetime
 from bson import ObjectId
+from cache_keys import to_local_time
 
 
 class PyObjectId(ObjectId):
@@ -82,8 +83,21 @@ class LogoutResponse(BaseModel):
     message: str = "Logged out"
 
 
+# Location Models
+class LocationMixin(BaseModel):
+    """Optional location; weather is looked up at the nearest KNMI station."""
+    latitude: Optional[float] = Field(default=None, ge=-90, le=90)
+    longitude: Optional[float] = Field(default=None, ge=-180, le=180)
+    
+    @model_validator(mode="after")
+    def check_location(self):
+        if (self.latitude is None) != (self.longitude is None):
+            raise ValueError("latitude and longitude must be given together")
+        return self
+
+
 # Activity Models
-class ActivityBase(BaseModel):
+class ActivityBase(LocationMixin):
     """Base activity model with common fields."""
     title: str = Field(..., min_length=1, max_length=200)
     date: datetime
@@ -123,8 +137,20 @@ class ActivityInDB(ActivityBase):
         json_encoders = {ObjectId: str}
 
 
+class ActivityImportError(BaseModel):
+    """Why one entry of a bulk import was not created."""
+    index: int
+    error: str
+
+
+class ActivityBulkResponse(BaseModel):
+    """Bulk create response model; indexes refer to positions in the import."""
+    created: List[ActivityResponse]
+    errors: List[ActivityImportError]
+
+
 # Weather Advice Models
-class WeatherAdviceRequest(BaseModel):
+class WeatherAdviceRequest(LocationMixin):
     """Weather advice request model."""
     date: datetime
     activity: str = Field(..., min_length=1, max_length=200)
@@ -134,7 +160,61 @@ class WeatherAdviceResponse(BaseModel):
     """Weather advice response model."""
     advice: str = Field(..., pattern="^(yes|no)$")
     explanation: str
-    source: str = Field(..., pattern="^(cache|live)$")
+    source: str = Field(..., pattern="^(cache|stale|live|rules)$")
+
+
+class WeatherAdviceBatchRequest(BaseModel):
+    """Batch weather advice request model."""
+    items: List[WeatherAdviceRequest] = Field(..., min_length=1, max_length=100)
+
+
+class WeatherAdviceBatchError(BaseModel):
+    """Why the advice for one item of a batch could not be computed."""
+    index: int
+    status_code: int
+    error: str
+
+
+class WeatherAdviceBatchResponse(BaseModel):
+    """
+    Batch weather advice response model, in the same order as the request items.
+    Items that failed have a null result and an entry in errors.
+    """
+    results: List[Optional[WeatherAdviceResponse]]
+    errors: List[WeatherAdviceBatchError]
+
+
+class BestDayRequest(BaseModel):
+    """Best day search request model."""
+    activity: str = Field(..., min_length=1, max_length=200)
+    start_date: datetime
+    end_date: datetime
+    
+    @model_validator(mode="after")
+    def check_date_range(self):
+        # Compare in local time, so a timezone-aware date can be checked against a naive one
+        start_date, end_date = to_local_time(self.start_date), to_local_time(self.end_date)
+        if end_date < start_date:
+            raise ValueError("end_date must not be before start_date")
+        if (end_date - start_date).days > 30:
+            raise ValueError("Date range cannot be longer than 31 days")
+        return self
+
+
+class RankedDay(BaseModel):
+    """A single day in a best day search, with its rule-based verdict and score."""
+    date: datetime
+    advice: str = Field(..., pattern="^(yes|no)$")
+    explanation: str
+    score: float = Field(..., ge=0, le=1)
+
+
+class BestDayResponse(BaseModel):
+    """Best day search response model, with days ordered from most to least suitable."""
+    activity: str
+    best_date: Optional[datetime] = None
+    summary: str
+    days: List[RankedDay]
 
 
 class WeatherAdviceInDB(BaseModel):
@@ -142,6 +222,7 @@ class WeatherAdviceInDB(BaseModel):
     id: Optional[PyObjectId] = Field(default_factory=PyObjectId, alias="_id")
     request_date: datetime
     activity: str
+    station: Optional[int] = None
     weather_data_summary: dict
     llm_advice: str = Field(..., pattern="^(yes|no)$")
     llm_explanation: str
@@ -0,0 +1,123 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Optional
+import logging
+from fastapi import HTTPException
+from database import get_activity_database
+from weather_advice_service import get_weather_advice_service
+
+logger = logging.getLogger(__name__)
+
+# Set to "false" to only compute advice when it is requested
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "true").lower() == "true"
+
+# How often upcoming activities are scanned and their advice refreshed
+PREFETCH_INTERVAL = timedelta(minutes=float(os.getenv("PREFETCH_INTERVAL_MINUTES", 30)))
+
+# Only activities up to this far ahead are prefetched
+PREFETCH_HORIZON = timedelta(days=float(os.getenv("PREFETCH_HORIZON_DAYS", 7)))
+
+# Max concurrent KNMI/LLM computations while prefetching, kept low to leave room for users
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", 2))
+
+# Distinct advice keys handed to the advice service per batch
+PREFETCH_BATCH_SIZE = 100
+
+
+class AdvicePrefetcher:
+    """
+    Background task that warms the weather and advice caches for upcoming activities,
+    so the dashboard is served from cache instead of waiting on KNMI and the LLM.
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.failures = 0
+        self.keys_prefetched = 0
+        self.keys_failed = 0
+        self.last_run_at: Optional[datetime] = None
+        self.last_run_seconds: Optional[float] = None
+
+    def start(self) -> None:
+        """Start the prefetch loop if it is enabled and not already running."""
+        if not PREFETCH_ENABLED or self._task is not None:
+            return
+        self._task = asyncio.ensure_future(self._run_forever())
+        logger.info(f"Advice prefetcher started (every {PREFETCH_INTERVAL}, {PREFETCH_HORIZON} ahead)")
+
+    async def stop(self) -> None:
+        """Cancel the prefetch loop and wait for it to finish."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run_forever(self) -> None:
+        while True:
+            try:
+                await self.prefetch_once()
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Advice prefetch failed: {e}")
+            await asyncio.sleep(PREFETCH_INTERVAL.total_seconds())
+
+    async def prefetch_once(self) -> int:
+        """
+        Refresh advice for every distinct (date, activity, station) among upcoming activities.
+        Returns the number of distinct keys that were prefetched.
+        """
+        started = datetime.now()
+        now = datetime.utcnow()
+        activities = await get_activity_database().get_upcoming_activity_keys(now, now + PREFETCH_HORIZON)
+
+        # Activities that share a date bucket, normalized title and station need only one lookup.
+        # MongoDB returns naive UTC dates, while naive dates in keys mean Dutch local time.
+        advice_service = get_weather_advice_service()
+        keys = list(dict.fromkeys(
+            advice_service.make_key(date.replace(tzinfo=timezone.utc), title, latitude, longitude)
+            for date, title, latitude, longitude in activities
+        ))
+
+        for offset in range(0, len(keys), PREFETCH_BATCH_SIZE):
+            results = await advice_service.get_advice_for_keys(
+                keys[offset:offset + PREFETCH_BATCH_SIZE],
+                concurrency=PREFETCH_CONCURRENCY,
+                # Stale advice is refreshed within the same concurrency limit, not all at once
+                await_refreshes=True
+            )
+            self.keys_failed += sum(1 for result in results if isinstance(result, HTTPException))
+
+        self.runs += 1
+        self.keys_prefetched += len(keys)
+        self.last_run_at = started
+        self.last_run_seconds = round((datetime.now() - started).total_seconds(), 3)
+        logger.info(f"Prefetched advice for {len(keys)} keys from {len(activities)} upcoming activities")
+        return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return counters for monitoring."""
+        return {
+            "enabled": PREFETCH_ENABLED,
+            "running": self._task is not None and not self._task.done(),
+            "runs": self.runs,
+            "failures": self.failures,
+            "keys_prefetched": self.keys_prefetched,
+            "keys_failed": self.keys_failed,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+            "last_run_seconds": self.last_run_seconds,
+        }
+
+
+# Global prefetcher instance
+advice_prefetcher = AdvicePrefetcher()
+
+
+def get_advice_prefetcher() -> AdvicePrefetcher:
+    """Get the advice prefetcher instance."""
+    return advice_prefetcher
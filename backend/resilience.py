@@ -0,0 +1,265 @@
+import asyncio
+import contextvars
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, TypeVar
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Consecutive failures after which an upstream is considered down
+UPSTREAM_FAILURE_THRESHOLD = int(os.getenv("UPSTREAM_FAILURE_THRESHOLD", 5))
+
+# How long an upstream that is down is skipped before a single probe request is let through
+UPSTREAM_RESET_SECONDS = float(os.getenv("UPSTREAM_RESET_SECONDS", 30))
+
+# Number of recent call durations kept per upstream for latency percentiles
+LATENCY_SAMPLES = 512
+
+# Absolute event loop time by which the current request must be answered, if any
+_request_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit breaker is open."""
+
+
+class UpstreamError(Exception):
+    """An upstream answered, but with a response that should count as a failure (e.g. 5xx)."""
+
+
+@contextmanager
+def deadline_scope(seconds: float) -> Iterator[None]:
+    """
+    Give everything awaited inside this block, including tasks it starts, a shared time budget.
+    Upstream calls made through an UpstreamGuard time out when the budget runs out, so the
+    slowest dependency cannot hold the request longer than this.
+    """
+    deadline = asyncio.get_running_loop().time() + seconds
+    current = _request_deadline.get()
+    # A nested scope can only shorten the budget of the scope around it
+    token = _request_deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _request_deadline.reset(token)
+
+
+def remaining_budget() -> Optional[float]:
+    """Seconds left in the current deadline scope, or None outside of one."""
+    deadline = _request_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - asyncio.get_running_loop().time()
+
+
+async def hedged(fn: Callable[[], Awaitable[T]], hedge_delay_seconds: float) -> T:
+    """
+    Run fn(), and if it has not finished after hedge_delay_seconds start a second attempt.
+    The first attempt to succeed wins and the other is cancelled. Only use this for
+    idempotent requests.
+    """
+    first = asyncio.ensure_future(fn())
+    done, _ = await asyncio.wait({first}, timeout=hedge_delay_seconds)
+    if done:
+        return first.result()
+
+    second = asyncio.ensure_future(fn())
+    pending = {first, second}
+    error: Optional[BaseException] = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+class CircuitBreaker:
+    """
+    Classic closed / open / half-open circuit breaker.
+    After failure_threshold consecutive failures the circuit opens and calls are rejected
+    for reset_seconds; then one probe call is allowed, which closes the circuit on success
+    and opens it again on failure.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.times_opened = 0
+        self.rejected = 0
+
+    def allow_request(self) -> bool:
+        """Whether a call may go through now; claims the probe slot when half-open."""
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.reset_seconds:
+                return False
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def is_open(self) -> bool:
+        """Whether calls would currently be rejected, without claiming the probe slot."""
+        if self.state == self.OPEN:
+            return time.monotonic() - self._opened_at < self.reset_seconds
+        return self.state == self.HALF_OPEN and self._probe_in_flight
+
+    def record_success(self) -> None:
+        self._probe_in_flight = False
+        self.consecutive_failures = 0
+        self.state = self.CLOSED
+
+    def record_failure(self) -> None:
+        self._probe_in_flight = False
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """Give up the probe slot without a verdict, e.g. when the caller was cancelled."""
+        self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        """Return counters for monitoring."""
+        return {
+            "state": self.OPEN if self.is_open() else self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
+
+
+class LatencyTracker:
+    """Keeps the most recent call durations and reports percentiles in milliseconds."""
+
+    def __init__(self, max_samples: int = LATENCY_SAMPLES):
+        self._samples: deque = deque(maxlen=max_samples)
+        self.count = 0
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+        self.count += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return percentiles over the recent samples."""
+        if not self._samples:
+            return {"count": self.count, "p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+
+        samples = sorted(self._samples)
+
+        def percentile(fraction: float) -> float:
+            return round(samples[min(len(samples) - 1, int(fraction * len(samples)))] * 1000, 1)
+
+        return {
+            "count": self.count,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "max_ms": round(samples[-1] * 1000, 1),
+        }
+
+
+class UpstreamGuard:
+    """
+    Wraps calls to one upstream with a deadline, a circuit breaker and latency tracking.
+    Each call is limited to deadline_seconds, or to what is left of the surrounding
+    deadline_scope if that is shorter. Timeouts and exceptions count as failures.
+    """
+
+    def __init__(self, name: str, deadline_seconds: float,
+                 failure_threshold: int = UPSTREAM_FAILURE_THRESHOLD,
+                 reset_seconds: float = UPSTREAM_RESET_SECONDS):
+        self.name = name
+        self.deadline_seconds = deadline_seconds
+        self.breaker = CircuitBreaker(failure_threshold, reset_seconds)
+        self.latency = LatencyTracker()
+        self.timeouts = 0
+        self.failures = 0
+        # Calls cut short by the caller's deadline_scope rather than the upstream
+        self.budget_exhausted = 0
+
+    def is_available(self) -> bool:
+        """Whether calls would currently be attempted; use to skip straight to a fallback."""
+        if self.breaker.is_open():
+            self.breaker.rejected += 1
+            return False
+        return True
+
+    async def call(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run fn() under the deadline and circuit breaker.
+        Only the upstream being slower than deadline_seconds counts against the breaker; when
+        the caller's own deadline_scope is what runs out, the call fails without a verdict.
+        """
+        timeout = self.deadline_seconds
+        budget = remaining_budget()
+        limited_by_budget = budget is not None and budget < timeout
+        if limited_by_budget:
+            timeout = budget
+        if timeout <= 0:
+            # The request has no time left; fail fast without calling or blaming the upstream
+            self.budget_exhausted += 1
+            raise asyncio.TimeoutError()
+
+        if not self.breaker.allow_request():
+            self.breaker.rejected += 1
+            raise CircuitOpenError(f"{self.name} circuit is open")
+
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(fn(), timeout)
+        except asyncio.TimeoutError:
+            if limited_by_budget:
+                self.budget_exhausted += 1
+                self.breaker.release()
+            else:
+                self.timeouts += 1
+                self.breaker.record_failure()
+                logger.warning(f"{self.name} call exceeded its {timeout:.2f}s deadline")
+            raise
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        except Exception:
+            self.failures += 1
+            self.breaker.record_failure()
+            raise
+        finally:
+            self.latency.record(time.perf_counter() - started)
+
+        self.breaker.record_success()
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Return counters for monitoring."""
+        return {
+            "circuit": self.breaker.stats(),
+            "deadline_seconds": self.deadline_seconds,
+            "timeouts": self.timeouts,
+            "budget_exhausted": self.budget_exhausted,
+            "failures": self.failures,
+            "latency": self.latency.stats(),
+        }
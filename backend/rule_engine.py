@@ -0,0 +1,289 @@
+"""
+Rule-based activity suitability, used when the LLM is unavailable or not needed.
+
+Activities are classified into a weather category by keyword, then each weather
+sample is checked against that category's rules. The rules are plain data in
+RULE_TABLE and are compiled once: keywords into a single regular expression, rules
+into threshold arrays that are evaluated with NumPy over any number of samples
+(hours of a day, days of a month) at once.
+
+Besides the verdict, every sample gets a 0-1 suitability score used for ranking
+and a margin: how far, in units of FIELD_SCALES, the weather is from the nearest
+threshold that would change the verdict. A large margin means a clear-cut case.
+
+A sample that summarizes many days (see climatology.py) can carry "<field>_low" and
+"<field>_high" bounds: values that most of those days stay above and below. A "no"
+rule is then checked against the bound that lets it hold most easily and a "yes" rule
+against the bound that lets it hold least easily, so the verdict holds on most days
+rather than on a typical one.
+"""
+import re
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+
+# Defaults used when a weather sample does not report a measurement
+FIELD_DEFAULTS = {"temperature": 15, "precipitation_mm": 0, "wind_speed_kmh": 10, "condition": "unknown"}
+
+# A margin of 1 means the sample is this far from the nearest deciding threshold
+FIELD_SCALES = {"temperature": 5.0, "precipitation_mm": 10.0, "wind_speed_kmh": 10.0}
+
+# Margin reported when no threshold can change the verdict (e.g. indoor activities)
+MAX_MARGIN = 10.0
+
+# Fields that may carry "<field>_low" / "<field>_high" bounds
+BOUNDED_FIELDS = ("temperature", "precipitation_mm", "wind_speed_kmh")
+
+# Categories in order of precedence: an activity matching keywords of several
+# categories gets the first one. Each rule is a list of conditions that must all
+# hold; the first matching rule decides, otherwise the default applies. The
+# penalty terms add up to a 0-1 penalty, and the score is 1 - penalty.
+RULE_TABLE: List[Dict[str, Any]] = [
+    {
+        "category": "indoor",
+        "keywords": ["shopping", "museum", "cinema", "reading", "cooking", "studying"],
+        "rules": [],
+        "default": ("yes", "Indoor activities are generally not affected by weather conditions."),
+        "penalty": [],
+    },
+    {
+        "category": "winter",
+        "keywords": ["skiing", "snowboarding", "ice skating", "sledding"],
+        "rules": [
+            {"when": [("temperature", "<", 5), ("condition", "in", ("snow", "cloudy"))],
+             "advice": "yes", "explanation": "Good conditions for winter activities with cold temperatures."},
+        ],
+        "default": ("no", "Winter activities require colder temperatures and preferably snow."),
+        "penalty": [
+            {"field": "temperature", "weight": 0.7, "offset": -5, "scale": 10},
+            {"field": "condition", "weight": 0.3, "not_in": ("snow",)},
+        ],
+    },
+    {
+        "category": "water",
+        "keywords": ["swimming", "sailing", "surfing", "fishing", "kayaking"],
+        "rules": [
+            {"when": [("temperature", "<", 15)],
+             "advice": "no", "explanation": "Water activities are not recommended in cold temperatures."},
+            {"when": [("precipitation_mm", ">", 20)],
+             "advice": "no", "explanation": "Heavy precipitation makes water activities unsafe."},
+            {"when": [("wind_speed_kmh", ">", 25)],
+             "advice": "no", "explanation": "Strong winds make water activities dangerous."},
+        ],
+        "default": ("yes", "Good conditions for water activities."),
+        "penalty": [
+            {"field": "temperature", "weight": 0.4, "offset": 25, "scale": -10},
+            {"field": "precipitation_mm", "weight": 0.3, "offset": 0, "scale": 20},
+            {"field": "wind_speed_kmh", "weight": 0.3, "offset": 0, "scale": 25},
+        ],
+    },
+    {
+        "category": "outdoor",
+        "keywords": ["hiking", "cycling", "running", "walking", "picnic", "camping", "gardening", "sports"],
+        "rules": [
+            {"when": [("precipitation_mm", ">", 30)],
+             "advice": "no", "explanation": "Heavy rain makes outdoor activities unpleasant and potentially unsafe."},
+            {"when": [("wind_speed_kmh", ">", 30)],
+             "advice": "no", "explanation": "Very strong winds make outdoor activities difficult and unsafe."},
+            {"when": [("temperature", "<", -5)],
+             "advice": "no", "explanation": "Extremely cold temperatures make outdoor activities uncomfortable."},
+            {"when": [("temperature", ">", 35)],
+             "advice": "no", "explanation": "Very high temperatures can be dangerous for outdoor activities."},
+            {"when": [("precipitation_mm", ">", 10)],
+             "advice": "no", "explanation": "Light to moderate rain makes outdoor activities less enjoyable."},
+        ],
+        "default": ("yes", "Good weather conditions for outdoor activities. Temperature: {temperature}°C, minimal precipitation."),
+        "penalty": [
+            {"field": "precipitation_mm", "weight": 0.5, "offset": 0, "scale": 30},
+            {"field": "wind_speed_kmh", "weight": 0.25, "offset": 0, "scale": 30},
+            {"field": "temperature", "weight": 0.25, "offset": 18, "scale": 23, "absolute": True},
+        ],
+    },
+]
+
+# Rules for activities that match no category
+UNKNOWN_CATEGORY: Dict[str, Any] = {
+    "category": None,
+    "keywords": [],
+    "rules": [
+        {"when": [("precipitation_mm", ">", 20)],
+         "advice": "no", "explanation": "Weather conditions may not be suitable for this activity."},
+        {"when": [("wind_speed_kmh", ">", 25)],
+         "advice": "no", "explanation": "Weather conditions may not be suitable for this activity."},
+    ],
+    "default": ("yes", "Weather conditions appear suitable for this activity."),
+    "penalty": [
+        {"field": "precipitation_mm", "weight": 0.6, "offset": 0, "scale": 20},
+        {"field": "wind_speed_kmh", "weight": 0.4, "offset": 0, "scale": 25},
+    ],
+}
+
+
+class Verdict(NamedTuple):
+    """Rule-based verdict for one weather sample."""
+    advice: str
+    explanation: str
+    score: float
+    margin: float
+
+
+class _Samples:
+    """Weather samples as one array per field."""
+
+    def __init__(self, weather_samples: Sequence[Dict[str, Any]]):
+        self.fields = {
+            field: np.array(
+                [sample.get(field, default) for sample in weather_samples],
+                dtype=object if field == "condition" else float
+            )
+            for field, default in FIELD_DEFAULTS.items()
+        }
+        # Samples without a bound use their own value for it
+        for field in BOUNDED_FIELDS:
+            for bound in ("low", "high"):
+                values = np.array(
+                    [sample.get(f"{field}_{bound}", np.nan) for sample in weather_samples], dtype=float
+                )
+                self.fields[f"{field}_{bound}"] = np.where(np.isnan(values), self.fields[field], values)
+        self.size = len(weather_samples)
+
+
+class _CompiledCategory:
+    """A category from RULE_TABLE, ready to evaluate over arrays of samples."""
+
+    def __init__(self, spec: Dict[str, Any]):
+        self.name: Optional[str] = spec["category"]
+        self.rules = spec["rules"]
+        self.outcomes = [(rule["advice"], rule["explanation"]) for rule in self.rules] + [spec["default"]]
+        self.penalty = spec["penalty"]
+
+    def _condition(self, samples: _Samples, condition: Tuple[str, str, Any],
+                   advice: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Evaluate one condition of a rule with the given advice. Returns whether it holds
+        and how far (in FIELD_SCALES) the sample is from its threshold; categorical
+        conditions cannot be moved by a small change in the weather, so their distance
+        is infinite.
+        """
+        field, operator, threshold = condition
+        if operator == "in":
+            return np.isin(samples.fields[field], threshold), np.full(samples.size, np.inf)
+        # "no" rules hold if enough days meet the condition, "yes" rules only if most days do
+        holds_easily = advice == "no"
+        bound = "low" if (operator == "<") == holds_easily else "high"
+        values = samples.fields[f"{field}_{bound}"]
+        holds = values < threshold if operator == "<" else values > threshold
+        return holds, np.abs(values - threshold) / FIELD_SCALES[field]
+
+    def evaluate(self, samples: _Samples) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return the index of the deciding outcome, the margin and the score per sample."""
+        default_index = len(self.rules)
+        matches = []
+        # Distance until a matching rule stops matching, or a non-matching rule starts to
+        unmatch_distances = []
+        match_distances = []
+        for rule in self.rules:
+            rule_holds = np.ones(samples.size, dtype=bool)
+            to_unmatch = np.full(samples.size, np.inf)
+            to_match = np.zeros(samples.size)
+            for condition in rule["when"]:
+                holds, distance = self._condition(samples, condition, rule["advice"])
+                rule_holds &= holds
+                to_unmatch = np.minimum(to_unmatch, np.where(holds, distance, 0.0))
+                to_match = np.maximum(to_match, np.where(holds, 0.0, distance))
+            matches.append(rule_holds)
+            unmatch_distances.append(to_unmatch)
+            match_distances.append(to_match)
+
+        # The first matching rule wins
+        choice = np.full(samples.size, default_index)
+        for rule_index in reversed(range(len(self.rules))):
+            choice[matches[rule_index]] = rule_index
+
+        # The verdict holds while some rule with the same advice still matches and
+        # no rule with the other advice starts matching
+        chosen_advice = np.array([advice for advice, _ in self.outcomes], dtype=object)[choice]
+        keep = np.where(choice == default_index, np.inf, 0.0)
+        flip = np.full(samples.size, np.inf)
+        for rule_index, rule in enumerate(self.rules):
+            same_advice = chosen_advice == rule["advice"]
+            keep = np.where(same_advice & matches[rule_index],
+                            np.maximum(keep, unmatch_distances[rule_index]), keep)
+            flip = np.where(~same_advice, np.minimum(flip, match_distances[rule_index]), flip)
+        margin = np.minimum(np.minimum(keep, flip), MAX_MARGIN)
+
+        penalty = np.zeros(samples.size)
+        for term in self.penalty:
+            values = samples.fields[term["field"]]
+            if "not_in" in term:
+                component = (~np.isin(values, term["not_in"])).astype(float)
+            else:
+                component = (values - term["offset"]) / term["scale"]
+                if term.get("absolute"):
+                    component = np.abs(component)
+                component = np.clip(component, 0, 1)
+            penalty += term["weight"] * component
+        score = 1.0 - np.clip(penalty, 0, 1)
+
+        return choice, margin, score
+
+
+class RuleEngine:
+    """Keyword classification and vectorized rule evaluation compiled from a rule table."""
+
+    def __init__(self, rule_table: List[Dict[str, Any]] = RULE_TABLE,
+                 unknown_category: Dict[str, Any] = UNKNOWN_CATEGORY):
+        self._categories = {spec["category"]: _CompiledCategory(spec) for spec in rule_table}
+        self._unknown = _CompiledCategory(unknown_category)
+
+        self._keyword_category: Dict[str, str] = {}
+        self._precedence: Dict[str, int] = {}
+        for precedence, spec in enumerate(rule_table):
+            self._precedence[spec["category"]] = precedence
+            for keyword in spec["keywords"]:
+                self._keyword_category.setdefault(keyword, spec["category"])
+        # One pass over the activity finds every keyword; the lookahead lets matches
+        # overlap, so a keyword inside a longer one is still seen
+        alternatives = sorted(self._keyword_category, key=len, reverse=True)
+        self._keyword_pattern = re.compile("(?=(" + "|".join(re.escape(keyword) for keyword in alternatives) + "))")
+
+    def classify(self, activity: str) -> Optional[str]:
+        """Map an activity to a weather category, or None if it is not recognized."""
+        found = {self._keyword_category[match.group(1)] for match in self._keyword_pattern.finditer(activity.lower())}
+        if not found:
+            return None
+        return min(found, key=self._precedence.__getitem__)
+
+    def keywords(self, activity: str) -> List[str]:
+        """The category keywords that occur in an activity, longest first."""
+        found = {match.group(1) for match in self._keyword_pattern.finditer(activity.lower())}
+        return sorted(found, key=len, reverse=True)
+
+    def evaluate(self, weather_samples: Sequence[Dict[str, Any]], category: Optional[str]) -> List[Verdict]:
+        """Evaluate the rules of a category (None for unrecognized activities) over weather samples."""
+        if not weather_samples:
+            return []
+
+        compiled = self._categories.get(category, self._unknown) if category is not None else self._unknown
+        choice, margin, score = compiled.evaluate(_Samples(weather_samples))
+
+        verdicts = []
+        for index, sample in enumerate(weather_samples):
+            advice, explanation = compiled.outcomes[choice[index]]
+            explanation = explanation.format(temperature=sample.get("temperature", FIELD_DEFAULTS["temperature"]))
+            if "dry_day_fraction" in sample:
+                explanation += f" Historically, {sample['dry_day_fraction']:.0%} of these days are dry."
+            verdicts.append(Verdict(advice, explanation, round(float(score[index]), 4), round(float(margin[index]), 4)))
+        return verdicts
+
+    def recommend(self, weather_data: Dict[str, Any], activity: str) -> Verdict:
+        """Classify an activity and evaluate a single weather sample."""
+        return self.evaluate([weather_data], self.classify(activity))[0]
+
+
+# Global rule engine, compiled once at import
+rule_engine = RuleEngine()
+
+
+def get_rule_engine() -> RuleEngine:
+    """Get the rule engine instance."""
+    return rule_engine
@@ -0,0 +1,137 @@
+"""
+KNMI automatic weather stations and a nearest-station lookup.
+
+Instead of scanning every station per request, the Netherlands is divided into a
+grid of small cells and, once at import time, each cell gets the short list of
+stations that can be nearest to some point inside it. Resolving a location then
+only compares distances to that handful of candidates. Locations outside the grid
+are looked up in the nearest edge cell, and locations too far from any station
+resolve to no station at all.
+"""
+import math
+import os
+from typing import NamedTuple, Optional
+import numpy as np
+
+# Grid resolution in degrees; 0.05° is roughly 5.5 km north-south and 3.4 km east-west
+GRID_CELL_DEGREES = 0.05
+
+# Bounding box of the grid, covering the Netherlands with a small margin
+GRID_MIN_LATITUDE, GRID_MAX_LATITUDE = 50.6, 53.8
+GRID_MIN_LONGITUDE, GRID_MAX_LONGITUDE = 3.2, 7.4
+
+# Locations farther than this from their nearest station are not resolved to it
+MAX_STATION_DISTANCE_KM = float(os.getenv("MAX_STATION_DISTANCE_KM", 50))
+
+EARTH_RADIUS_KM = 6371.0
+
+
+class Station(NamedTuple):
+    """A KNMI weather station."""
+    number: int
+    name: str
+    latitude: float
+    longitude: float
+
+
+# KNMI automatic weather stations with daily data
+STATIONS = [
+    Station(215, "Voorschoten", 52.141, 4.437),
+    Station(225, "IJmuiden", 52.463, 4.555),
+    Station(235, "De Kooy", 52.928, 4.781),
+    Station(240, "Schiphol", 52.318, 4.790),
+    Station(242, "Vlieland", 53.241, 4.921),
+    Station(249, "Berkhout", 52.643, 4.979),
+    Station(251, "Hoorn (Terschelling)", 53.392, 5.346),
+    Station(257, "Wijk aan Zee", 52.506, 4.603),
+    Station(260, "De Bilt", 52.100, 5.180),
+    Station(267, "Stavoren", 52.898, 5.384),
+    Station(269, "Lelystad", 52.458, 5.520),
+    Station(270, "Leeuwarden", 53.224, 5.752),
+    Station(273, "Marknesse", 52.703, 5.888),
+    Station(275, "Deelen", 52.056, 5.873),
+    Station(277, "Lauwersoog", 53.413, 6.200),
+    Station(278, "Heino", 52.435, 6.259),
+    Station(279, "Hoogeveen", 52.750, 6.574),
+    Station(280, "Eelde", 53.125, 6.585),
+    Station(283, "Hupsel", 52.069, 6.657),
+    Station(286, "Nieuw Beerta", 53.196, 7.150),
+    Station(290, "Twenthe", 52.274, 6.891),
+    Station(310, "Vlissingen", 51.442, 3.596),
+    Station(319, "Westdorpe", 51.226, 3.861),
+    Station(323, "Wilhelminadorp", 51.527, 3.884),
+    Station(330, "Hoek van Holland", 51.991, 4.122),
+    Station(340, "Woensdrecht", 51.449, 4.342),
+    Station(344, "Rotterdam", 51.962, 4.447),
+    Station(348, "Cabauw", 51.970, 4.926),
+    Station(350, "Gilze-Rijen", 51.566, 4.936),
+    Station(356, "Herwijnen", 51.859, 5.146),
+    Station(370, "Eindhoven", 51.451, 5.377),
+    Station(375, "Volkel", 51.659, 5.707),
+    Station(377, "Ell", 51.198, 5.763),
+    Station(380, "Maastricht", 50.906, 5.762),
+    Station(391, "Arcen", 51.498, 6.197),
+]
+
+
+def haversine_km(latitude_a, longitude_a, latitude_b, longitude_b):
+    """Great-circle distance in km; works element-wise on NumPy arrays."""
+    latitude_a, longitude_a, latitude_b, longitude_b = map(np.radians, (latitude_a, longitude_a, latitude_b, longitude_b))
+    a = np.sin((latitude_b - latitude_a) / 2) ** 2 \
+        + np.cos(latitude_a) * np.cos(latitude_b) * np.sin((longitude_b - longitude_a) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+class StationIndex:
+    """Grid hash mapping every cell to the stations that can be nearest to a point in it."""
+
+    def __init__(self, stations=STATIONS, cell_degrees: float = GRID_CELL_DEGREES):
+        self.stations = list(stations)
+        self.cell_degrees = cell_degrees
+        self.rows = math.ceil((GRID_MAX_LATITUDE - GRID_MIN_LATITUDE) / cell_degrees)
+        self.columns = math.ceil((GRID_MAX_LONGITUDE - GRID_MIN_LONGITUDE) / cell_degrees)
+
+        centre_latitudes = GRID_MIN_LATITUDE + (np.arange(self.rows) + 0.5) * cell_degrees
+        centre_longitudes = GRID_MIN_LONGITUDE + (np.arange(self.columns) + 0.5) * cell_degrees
+        grid_latitudes, grid_longitudes = np.meshgrid(centre_latitudes, centre_longitudes, indexing="ij")
+
+        station_latitudes = np.array([station.latitude for station in self.stations])
+        station_longitudes = np.array([station.longitude for station in self.stations])
+        # Distances from every cell centre to every station, shape (rows, columns, stations)
+        distances = haversine_km(
+            grid_latitudes[..., None], grid_longitudes[..., None],
+            station_latitudes, station_longitudes
+        )
+        # A station can only be nearest somewhere in the cell if it is at most one cell
+        # diagonal farther from the centre than the station nearest to the centre
+        diagonal_km = haversine_km(GRID_MIN_LATITUDE, GRID_MIN_LONGITUDE,
+                                   GRID_MIN_LATITUDE + cell_degrees, GRID_MIN_LONGITUDE + cell_degrees)
+        candidates = distances <= distances.min(axis=-1, keepdims=True) + diagonal_km
+        self._candidates = [
+            [np.flatnonzero(candidates[row, column]) for column in range(self.columns)]
+            for row in range(self.rows)
+        ]
+        self._station_latitudes = station_latitudes
+        self._station_longitudes = station_longitudes
+
+    def nearest(self, latitude: float, longitude: float) -> Optional[Station]:
+        """Get the station nearest to a location, or None if none is within MAX_STATION_DISTANCE_KM."""
+        row = int((latitude - GRID_MIN_LATITUDE) // self.cell_degrees)
+        column = int((longitude - GRID_MIN_LONGITUDE) // self.cell_degrees)
+        candidates = self._candidates[min(max(row, 0), self.rows - 1)][min(max(column, 0), self.columns - 1)]
+
+        distances = haversine_km(latitude, longitude,
+                                 self._station_latitudes[candidates], self._station_longitudes[candidates])
+        closest = int(np.argmin(distances))
+        if distances[closest] > MAX_STATION_DISTANCE_KM:
+            return None
+        return self.stations[candidates[closest]]
+
+
+# Global index, built once at import
+station_index = StationIndex()
+
+
+def get_station_index() -> StationIndex:
+    """Get the nearest-station index."""
+    return station_index
@@ -1,12 +1,12 @@
 from fastapi import APIRouter, HTTPException, Depends
-from models import WeatherAdviceRequest, WeatherAdviceResponse, ErrorResponse
-from database import get_weather_advice_database, WeatherAdviceDatabase
-from knmi_service import get_knmi_service, KNMIService
-from llm_service import get_llm_service, LLMService
-from middleware import get_current_user
-from typing import Dict, Any
+from fastapi.responses import StreamingResponse
+from models import WeatherAdviceRequest, WeatherAdviceResponse, WeatherAdviceBatchRequest, WeatherAdviceBatchResponse, WeatherAdviceBatchError, BestDayRequest, BestDayResponse, ErrorResponse
+from weather_advice_service import get_weather_advice_service, WeatherAdviceService
+from prefetcher import get_advice_prefetcher
+from middleware import get_current_user, require_operator
+from typing import Dict, Any, AsyncIterator
 import logging
-from datetime import datetime
+import json
 
 logger = logging.getLogger(__name__)
 
@@ -17,67 +17,114 @@ router = APIRouter(prefix="/api/v1", tags=["weather-advice"])
 async def get_weather_advice(
     request: WeatherAdviceRequest,
     current_user: Dict[str, Any] = Depends(get_current_user),
-    weather_db: WeatherAdviceDatabase = Depends(get_weather_advice_database),
-    knmi_service: KNMIService = Depends(get_knmi_service),
-    llm_service: LLMService = Depends(get_llm_service)
+    advice_service: WeatherAdviceService = Depends(get_weather_advice_service)
 ) -> WeatherAdviceResponse:
     """
     Get weather advice for an activity on a specific date.
     First checks cache, then fetches live data if needed.
     """
     try:
-        # Check if we have cached advice for this date and activity
-        cached_advice = await weather_db.get_cached_advice(request.date, request.activity)
+        return await advice_service.get_advice(request.date, request.activity, request.latitude, request.longitude)
         
-        if cached_advice:
-            logger.info(f"Returning cached advice for {request.activity} on {request.date}")
-            return WeatherAdviceResponse(
-                advice=cached_advice.llm_advice,
-                explanation=cached_advice.llm_explanation,
-                source="cache"
-            )
-        
-        # No cached data, fetch live weather data
-        logger.info(f"Fetching live weather data for {request.activity} on {request.date}")
-        
-        # Get weather forecast from KNMI
-        weather_data = await knmi_service.get_weather_forecast(request.date)
-        if not weather_data:
-            raise HTTPException(
-                status_code=503,
-                detail="Unable to fetch weather data at this time"
-            )
-        
-        # Get LLM recommendation
-        advice, explanation = await llm_service.get_activity_recommendation(
-            weather_data, request.activity
+    except HTTPException:
+        # Re-raise HTTP exceptions
+        raise
+    except Exception as e:
+        logger.error(f"Error getting weather advice: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail="Internal server error while processing weather advice request"
         )
-        
-        # Save the advice to cache
-        await weather_db.save_advice(
-            request_date=request.date,
-            activity=request.activity,
-            weather_data_summary=weather_data,
-            llm_advice=advice,
-            llm_explanation=explanation
+
+
+@router.post("/weather-advice/stream")
+async def stream_weather_advice(
+    request: WeatherAdviceRequest,
+    current_user: Dict[str, Any] = Depends(get_current_user),
+    advice_service: WeatherAdviceService = Depends(get_weather_advice_service)
+) -> StreamingResponse:
+    """
+    Stream weather advice as Server-Sent Events.
+    A "preliminary" event with the rule-based verdict is sent as soon as the weather
+    is known, followed by a "final" event with the LLM advice. Cached advice is sent
+    as a single "final" event.
+    """
+    async def event_stream() -> AsyncIterator[str]:
+        try:
+            async for event, response in advice_service.stream_advice(
+                request.date, request.activity, request.latitude, request.longitude
+            ):
+                yield f"event: {event}\ndata: {response.model_dump_json()}\n\n"
+        except HTTPException as e:
+            yield f"event: error\ndata: {json.dumps({'error': e.detail})}\n\n"
+        except Exception as e:
+            logger.error(f"Error streaming weather advice: {e}")
+            yield f"event: error\ndata: {json.dumps({'error': 'Internal server error while processing weather advice request'})}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/weather-advice/batch", response_model=WeatherAdviceBatchResponse)
+async def get_weather_advice_batch(
+    request: WeatherAdviceBatchRequest,
+    current_user: Dict[str, Any] = Depends(get_current_user),
+    advice_service: WeatherAdviceService = Depends(get_weather_advice_service)
+) -> WeatherAdviceBatchResponse:
+    """
+    Get weather advice for many (date, activity) pairs in one request.
+    Results are returned in the same order as the requested items; items whose
+    advice could not be computed have a null result and are listed in errors.
+    """
+    try:
+        outcomes = await advice_service.get_advice_batch(
+            [(item.date, item.activity, item.latitude, item.longitude) for item in request.items]
         )
+        results = []
+        errors = []
+        for index, outcome in enumerate(outcomes):
+            if isinstance(outcome, HTTPException):
+                results.append(None)
+                errors.append(WeatherAdviceBatchError(index=index, status_code=outcome.status_code, error=outcome.detail))
+            else:
+                results.append(outcome)
+        return WeatherAdviceBatchResponse(results=results, errors=errors)
         
-        logger.info(f"Generated and cached new advice for {request.activity} on {request.date}")
-        
-        return WeatherAdviceResponse(
-            advice=advice,
-            explanation=explanation,
-            source="live"
+    except HTTPException:
+        # Re-raise HTTP exceptions
+        raise
+    except Exception as e:
+        logger.error(f"Error getting batch weather advice: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail="Internal server error while processing weather advice request"
         )
+
+
+@router.post("/weather-advice/best-day", response_model=BestDayResponse)
+async def find_best_day(
+    request: BestDayRequest,
+    current_user: Dict[str, Any] = Depends(get_current_user),
+    advice_service: WeatherAdviceService = Depends(get_weather_advice_service)
+) -> BestDayResponse:
+    """
+    Rank the days in a date range (up to 31 days) by suitability for an activity.
+    Returns the days ordered from most to least suitable with a short summary.
+    """
+    try:
+        return await advice_service.find_best_days(request.activity, request.start_date, request.end_date)
         
     except HTTPException:
         # Re-raise HTTP exceptions
         raise
     except Exception as e:
-        logger.error(f"Error getting weather advice: {e}")
+        logger.error(f"Error finding best day: {e}")
         raise HTTPException(
             status_code=500,
-            detail="Internal server error while processing weather advice request"
+            detail="Internal server error while processing best day request"
         )
 
 
@@ -88,4 +135,13 @@ async def weather_advice_health() -> Dict[str, str]:
         "status": "healthy",
         "service": "weather-advice",
         "message": "Weather advice service is operational"
-    }
\ No newline at end of file
+    }
+
+
+@router.get("/weather-advice/stats")
+async def weather_advice_stats(
+    current_user: Dict[str, Any] = Depends(require_operator),
+    advice_service: WeatherAdviceService = Depends(get_weather_advice_service)
+) -> Dict[str, Any]:
+    """Cache, request coalescing and prefetch counters for monitoring, for operators only."""
+    return {**advice_service.stats(), "prefetcher": get_advice_prefetcher().stats()}
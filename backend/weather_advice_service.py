@@ -0,0 +1,368 @@
+from fastapi import HTTPException
+from models import WeatherAdviceResponse, BestDayResponse, RankedDay, WeatherAdviceInDB
+from database import get_weather_advice_database, ADVICE_CACHE_TTL
+from knmi_service import get_knmi_service
+from llm_service import Recommendation, get_llm_service
+from cache import LRUTTLCache, SingleFlight
+from resilience import deadline_scope
+from cache_keys import AdviceKey, make_advice_key, normalize_activity, to_local_time
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple, Union
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of concurrent KNMI/LLM computations for a single batch request
+BATCH_CONCURRENCY = int(os.getenv("WEATHER_ADVICE_BATCH_CONCURRENCY", 4))
+
+# Total time budget for fetching weather and asking the LLM for one piece of advice;
+# whatever is still outstanding when it runs out falls back (mock weather, rule-based advice)
+ADVICE_DEADLINE_SECONDS = float(os.getenv("ADVICE_DEADLINE_SECONDS", 10))
+
+# Seconds to wait before refreshing stale advice again after a refresh failed or could
+# only produce rule-based fallback advice
+ADVICE_REFRESH_RETRY_SECONDS = float(os.getenv("ADVICE_REFRESH_RETRY_SECONDS", 60))
+
+# Number of top-ranked days summarized by the LLM in a best day search
+BEST_DAY_CANDIDATES = 3
+
+
+class WeatherAdviceService:
+    """Service that resolves weather advice from the cache or live KNMI + LLM data."""
+
+    def __init__(self):
+        # Registry of cache misses currently being computed, keyed by AdviceKey
+        self._in_flight = SingleFlight()
+        # Background refreshes of stale advice by key; references are kept until they finish
+        self._refresh_tasks: Dict[AdviceKey, asyncio.Task] = {}
+        # Keys whose last refresh did not succeed; they are not refreshed again until their entry expires
+        self._refresh_retry_after = LRUTTLCache(max_entries=10000, ttl_seconds=ADVICE_REFRESH_RETRY_SECONDS)
+        self.stale_served = 0
+        self.refreshes_started = 0
+        self.refreshes_failed = 0
+
+    def make_key(self, request_date: datetime, activity: str,
+                 latitude: Optional[float] = None, longitude: Optional[float] = None) -> AdviceKey:
+        """Build the cache key for a request, resolving its location to the nearest KNMI station."""
+        station = get_knmi_service().resolve_station(latitude, longitude)
+        return make_advice_key(request_date, activity, station)
+
+    async def get_advice(self, request_date: datetime, activity: str,
+                         latitude: Optional[float] = None, longitude: Optional[float] = None) -> WeatherAdviceResponse:
+        """
+        Get weather advice for an activity on a specific date, optionally at a location.
+        First checks cache, then fetches live data if needed. Requests are mapped to a
+        canonical key first, and concurrent misses for the same key share one upstream
+        computation.
+        """
+        weather_db = get_weather_advice_database()
+        key = self.make_key(request_date, activity, latitude, longitude)
+
+        # Check if we have cached advice for this date, activity and station
+        cached_advice = await weather_db.get_cached_advice(*key)
+
+        if cached_advice:
+            logger.info(f"Returning cached advice for {key.activity} on {key.request_date}")
+            return self._cached_response(key, cached_advice)
+
+        return await self._resolve_miss(key)
+
+    async def stream_advice(self, request_date: datetime, activity: str,
+                            latitude: Optional[float] = None,
+                            longitude: Optional[float] = None) -> AsyncIterator[Tuple[str, WeatherAdviceResponse]]:
+        """
+        Stream weather advice as (event, response) pairs.
+        Cache hits yield a single "final" event. Misses first yield a "preliminary"
+        rule-based verdict as soon as the weather is known, then the "final" LLM advice.
+        """
+        weather_db = get_weather_advice_database()
+        llm_service = get_llm_service()
+        key = self.make_key(request_date, activity, latitude, longitude)
+
+        cached_advice = await weather_db.get_cached_advice(*key)
+        if cached_advice:
+            yield "final", self._cached_response(key, cached_advice)
+            return
+
+        weather_data = await self._fetch_weather(key.request_date, key.station)
+        advice, explanation = llm_service.get_rule_based_recommendation(weather_data, key.activity)
+        yield "preliminary", WeatherAdviceResponse(
+            advice=advice,
+            explanation=explanation,
+            source="rules"
+        )
+
+        recommendation = await self._in_flight.do(key, lambda: self._generate_advice(key, weather_data))
+        yield "final", self._live_response(recommendation)
+
+    async def get_advice_batch(self, items: List[Tuple[datetime, str, Optional[float], Optional[float]]],
+                               concurrency: int = BATCH_CONCURRENCY) -> List[Union[WeatherAdviceResponse, HTTPException]]:
+        """
+        Get weather advice for many (date, activity, latitude, longitude) items.
+        Results follow the order of items; see get_advice_for_keys for failed items.
+        """
+        keys = [self.make_key(*item) for item in items]
+        return await self.get_advice_for_keys(keys, concurrency)
+
+    async def get_advice_for_keys(self, keys: List[AdviceKey],
+                                  concurrency: int = BATCH_CONCURRENCY,
+                                  await_refreshes: bool = False) -> List[Union[WeatherAdviceResponse, HTTPException]]:
+        """
+        Get weather advice for many canonical keys.
+        Duplicate keys are resolved once, cache hits are fetched together and misses
+        are computed with at most `concurrency` at a time. Stale hits are refreshed
+        under the same limit, in the background unless await_refreshes is set.
+        Results follow the order of keys. A miss that cannot be computed does not fail
+        the others: its result is the HTTPException it would have raised on its own.
+        """
+        weather_db = get_weather_advice_database()
+        unique_keys = list(dict.fromkeys(keys))
+
+        results: Dict[AdviceKey, Union[WeatherAdviceResponse, HTTPException]] = {}
+        cached = await weather_db.get_cached_advice_many(unique_keys)
+        for key, cached_advice in cached.items():
+            results[AdviceKey(*key)] = self._cached_response(AdviceKey(*key), cached_advice, refresh=False)
+
+        misses = [key for key in unique_keys if key not in results]
+        stale = [key for key, response in results.items() if response.source == "stale"]
+        refreshable = [key for key in stale if self._refresh_retry_after.get(key) is None]
+        logger.info(
+            f"Batch of {len(keys)} advice requests: {len(unique_keys)} unique, "
+            f"{len(results)} cached ({len(stale)} stale), {len(misses)} to compute"
+        )
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def resolve(key: AdviceKey) -> None:
+            async with semaphore:
+                try:
+                    results[key] = await self._resolve_miss(key)
+                except HTTPException as e:
+                    results[key] = e
+                except Exception as e:
+                    logger.error(f"Error getting advice for {key.activity} on {key.request_date}: {e}")
+                    results[key] = HTTPException(
+                        status_code=500,
+                        detail="Internal server error while processing weather advice request"
+                    )
+
+        if await_refreshes:
+            self.refreshes_started += len(refreshable)
+            await asyncio.gather(
+                *(resolve(key) for key in misses),
+                *(self._refresh(key, semaphore) for key in refreshable)
+            )
+        else:
+            for key in refreshable:
+                self._schedule_refresh(key, semaphore)
+            await asyncio.gather(*(resolve(key) for key in misses))
+
+        return [results[key] for key in keys]
+
+    async def find_best_days(self, activity: str, start_date: datetime, end_date: datetime) -> BestDayResponse:
+        """
+        Rank every day between start_date and end_date by suitability for an activity.
+        Weather for the whole window is fetched once and scored with the rule-based
+        checks as arrays; only the top candidates are summarized by the LLM.
+        """
+        knmi_service = get_knmi_service()
+        llm_service = get_llm_service()
+        activity = normalize_activity(activity)
+
+        first_day = to_local_time(start_date).replace(hour=0, minute=0, second=0, microsecond=0)
+        last_day = to_local_time(end_date).replace(hour=0, minute=0, second=0, microsecond=0)
+        days = (last_day - first_day).days + 1
+
+        weather_window = await knmi_service.get_weather_window(first_day, days)
+        if not weather_window:
+            raise HTTPException(
+                status_code=503,
+                detail="Unable to fetch weather data at this time"
+            )
+
+        recommendations = llm_service.get_window_recommendations(weather_window, activity)
+
+        # Suitable days first, then by score, then earliest date
+        order = sorted(
+            range(len(recommendations)),
+            key=lambda index: (recommendations[index][0] != "yes", -recommendations[index][2], index)
+        )
+
+        ranked_days = []
+        candidates = []
+        for index in order:
+            advice, explanation, score = recommendations[index]
+            day = first_day + timedelta(days=index)
+            ranked_days.append(RankedDay(date=day, advice=advice, explanation=explanation, score=score))
+            if len(candidates) < BEST_DAY_CANDIDATES:
+                candidates.append({
+                    "date": day.date().isoformat(),
+                    "advice": advice,
+                    "explanation": explanation,
+                    "score": score,
+                    "weather": weather_window[index]
+                })
+
+        summary = await llm_service.get_best_day_summary(candidates, activity)
+        best_date = ranked_days[0].date if ranked_days and ranked_days[0].advice == "yes" else None
+
+        logger.info(f"Ranked {days} days for {activity} starting {first_day.date()}")
+
+        return BestDayResponse(
+            activity=activity,
+            best_date=best_date,
+            summary=summary,
+            days=ranked_days
+        )
+
+    def _cached_response(self, key: AdviceKey, cached_advice: WeatherAdviceInDB,
+                         refresh: bool = True) -> WeatherAdviceResponse:
+        """
+        Build the response for cached advice. Advice older than ADVICE_CACHE_TTL is
+        returned as "stale" and, if refresh is set, refreshed in the background.
+        """
+        source = "cache"
+        if datetime.utcnow() - cached_advice.created_at > ADVICE_CACHE_TTL:
+            source = "stale"
+            self.stale_served += 1
+            if refresh:
+                self._schedule_refresh(key)
+
+        return WeatherAdviceResponse(
+            advice=cached_advice.llm_advice,
+            explanation=cached_advice.llm_explanation,
+            source=source
+        )
+
+    def _schedule_refresh(self, key: AdviceKey, semaphore: Optional[asyncio.Semaphore] = None) -> None:
+        """
+        Start a background refresh for key unless one is already running or its last
+        refresh failed less than ADVICE_REFRESH_RETRY_SECONDS ago.
+        Refreshes sharing a semaphore compute at most its limit at a time.
+        """
+        if key in self._refresh_tasks or self._in_flight.is_running(key):
+            return
+        if self._refresh_retry_after.get(key) is not None:
+            return
+
+        self.refreshes_started += 1
+        task = asyncio.ensure_future(self._refresh(key, semaphore))
+        self._refresh_tasks[key] = task
+        task.add_done_callback(lambda _: self._refresh_tasks.pop(key, None))
+
+    async def _refresh(self, key: AdviceKey, semaphore: Optional[asyncio.Semaphore] = None) -> None:
+        """
+        Recompute advice for key, logging instead of raising on failure. A rule-based
+        fallback is not cached, so the stale LLM advice stays in place; both a fallback
+        and a failure hold off the next refresh of key for ADVICE_REFRESH_RETRY_SECONDS.
+        """
+        if semaphore is not None:
+            async with semaphore:
+                return await self._refresh(key)
+
+        try:
+            recommendation = await self._in_flight.do(key, lambda: self._generate_advice(key))
+        except Exception as e:
+            logger.error(f"Error refreshing stale advice for {key.activity} on {key.request_date}: {e}")
+            self._refresh_failed(key)
+            return
+
+        if recommendation.source == "fallback":
+            logger.warning(f"LLM unavailable, keeping stale advice for {key.activity} on {key.request_date}")
+            self._refresh_failed(key)
+            return
+        logger.info(f"Refreshed stale advice for {key.activity} on {key.request_date}")
+
+    def _refresh_failed(self, key: AdviceKey) -> None:
+        """Hold off refreshing key again for ADVICE_REFRESH_RETRY_SECONDS."""
+        self.refreshes_failed += 1
+        self._refresh_retry_after.set(key, True)
+
+    async def _resolve_miss(self, key: AdviceKey) -> WeatherAdviceResponse:
+        """Compute advice for a cache miss, joining an identical computation if one is running."""
+        recommendation = await self._in_flight.do(key, lambda: self._generate_advice(key))
+        return self._live_response(recommendation)
+
+    def _live_response(self, recommendation: Recommendation) -> WeatherAdviceResponse:
+        """Build the response for freshly computed advice; rule-based fallbacks are marked as "rules"."""
+        return WeatherAdviceResponse(
+            advice=recommendation.advice,
+            explanation=recommendation.explanation,
+            source="rules" if recommendation.source == "fallback" else "live"
+        )
+
+    async def _generate_advice(self, key: AdviceKey, weather_data: Optional[Dict[str, Any]] = None) -> Recommendation:
+        """
+        Fetch live weather data (unless already provided), ask the LLM for a
+        recommendation and cache the result. Both upstream calls share ADVICE_DEADLINE_SECONDS.
+        Rule-based fallbacks for an unavailable LLM are not cached, so an outage does not
+        keep serving them for the whole ADVICE_CACHE_TTL once the LLM is back.
+        """
+        request_date, activity, station = key
+        weather_db = get_weather_advice_database()
+        llm_service = get_llm_service()
+
+        with deadline_scope(ADVICE_DEADLINE_SECONDS):
+            if weather_data is None:
+                weather_data = await self._fetch_weather(request_date, station)
+
+            # Get LLM recommendation
+            recommendation = await llm_service.get_activity_recommendation(
+                weather_data, activity
+            )
+
+        if recommendation.source == "fallback":
+            logger.info(f"Generated rule-based fallback advice for {activity} on {request_date}, not caching it")
+            return recommendation
+
+        # Save the advice to cache
+        await weather_db.save_advice(
+            request_date=request_date,
+            activity=activity,
+            station=station,
+            weather_data_summary=weather_data,
+            llm_advice=recommendation.advice,
+            llm_explanation=recommendation.explanation
+        )
+
+        logger.info(f"Generated and cached new advice for {activity} on {request_date}")
+        return recommendation
+
+    async def _fetch_weather(self, request_date: datetime, station: int) -> Dict[str, Any]:
+        """Get the weather forecast for a date at a KNMI station, raising 503 if it is unavailable."""
+        knmi_service = get_knmi_service()
+
+        # No cached data, fetch live weather data
+        logger.info(f"Fetching live weather data for {request_date}")
+
+        # Get weather forecast from KNMI
+        weather_data = await knmi_service.get_weather_forecast(request_date, station)
+        if not weather_data:
+            raise HTTPException(
+                status_code=503,
+                detail="Unable to fetch weather data at this time"
+            )
+        return weather_data
+
+    def stats(self) -> Dict[str, Any]:
+        """Return counters for monitoring."""
+        return {
+            "in_flight": self._in_flight.stats(),
+            "stale_served": self.stale_served,
+            "refreshes_started": self.refreshes_started,
+            "refreshes_failed": self.refreshes_failed,
+            "advice_memory_cache": get_weather_advice_database().memory_cache.stats(),
+            "knmi": get_knmi_service().stats(),
+            "llm": get_llm_service().stats(),
+        }
+
+
+# Global service instance
+weather_advice_service = WeatherAdviceService()
+
+
+def get_weather_advice_service() -> WeatherAdviceService:
+    """Get the weather advice service instance."""
+    return weather_advice_service
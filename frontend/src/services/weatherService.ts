@@ -10,7 +10,7 @@ interface WeatherAdviceRequest {
 interface WeatherAdviceResponse {
   advice: 'yes' | 'no';
   explanation: string;
-  source: 'cache' | 'live';
+  source: 'cache' | 'stale' | 'live';
 }
 
 // Convert backend response to frontend WeatherAssessment type